@@ -0,0 +1,246 @@
+"""Benchmark de carga de la API de licencias (server/main.py) en el mismo proceso.
+
+Arranca la app de FastAPI sin red (httpx + ASGITransport) contra una base de datos
+sembrada con N keys y lanza una mezcla de /validate, /activate, /generate y
+/licenses/list con la concurrencia indicada. Reporta throughput y latencias
+p50/p95/p99 por endpoint, y puede guardar/comparar resultados en JSON.
+
+Uso:
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/bench_api.py --keys 100000 --concurrency 50 --duration 30 --json base.json
+    python benchmarks/bench_api.py --keys 100000 --concurrency 50 --duration 30 --compare base.json
+
+Con --database-url se usa otra base (p. ej. un PostgreSQL local de pruebas): las
+keys sembradas se añaden a la tabla existente con bot_name "bench".
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MIX = "validate=90,activate=3,generate=2,list=5"
+BENCH_BOT = "bench"
+# Segundos máximos de espera a /ready (carga del filtro de keys con muchas keys)
+READY_TIMEOUT = 600
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=10000, help="Keys a sembrar (10k - 1M)")
+    parser.add_argument("--bound-ratio", type=float, default=0.9, help="Fracción de keys ya vinculadas a un HWID")
+    parser.add_argument("--invalid-ratio", type=float, default=0.05, help="Fracción de /validate con keys inexistentes")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20, help="Segundos de medición")
+    parser.add_argument("--warmup", type=float, default=2, help="Segundos previos que no se miden")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Pesos por endpoint (por defecto {DEFAULT_MIX})")
+    parser.add_argument("--sqlite-path", help="Archivo SQLite a usar; si ya existe y tiene keys se reutiliza")
+    parser.add_argument("--database-url", help="URL de otra base (PostgreSQL local de pruebas)")
+    parser.add_argument("--async-db", action="store_true", help="Activa DB_ASYNC=1")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    parser.add_argument("--compare", help="Comparar con un resultado JSON anterior")
+    parser.add_argument("--threshold", type=float, default=0.20, help="Regresión tolerada en p95/throughput (0.20 = 20%%)")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """Debe llamarse antes de importar el servidor: models.py lee el entorno al importarse."""
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        path = args.sqlite_path or os.path.join(tempfile.mkdtemp(prefix="authkey_bench_"), "licenses.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    if args.async_db:
+        os.environ["DB_ASYNC"] = "1"
+    # El benchmark mide capacidad, no el limitador
+    os.environ.setdefault("RATE_LIMIT_IP_RATE", "0")
+    os.environ.setdefault("RATE_LIMIT_KEY_RATE", "0")
+    sys.path.insert(0, os.path.join(ROOT, "server"))
+
+
+def seed(models, count, bound_ratio, rng):
+    """Siembra las keys de benchmark (o reutiliza las existentes). Devuelve (vinculadas, libres)."""
+    License = models.License
+    with models.SessionLocal() as db:
+        existing = db.query(License.key, License.hwid).filter(License.bot_name == BENCH_BOT).all()
+    if len(existing) >= count:
+        print(f"[bench] Reutilizando {len(existing)} keys existentes")
+        bound = [(row.key, row.hwid) for row in existing if row.hwid]
+        free = [row.key for row in existing if not row.hwid]
+        return bound, free
+
+    print(f"[bench] Sembrando {count} keys...")
+    now = datetime.datetime.utcnow()
+    bound, free = [], []
+    chunk = []
+    with models.engine.begin() as conn:
+        for n in range(count):
+            key = str(uuid.UUID(int=rng.getrandbits(128), version=4)).upper()
+            hwid = f"HWID-{n}" if rng.random() < bound_ratio else None
+            if hwid:
+                bound.append((key, hwid))
+            else:
+                free.append(key)
+            chunk.append({
+                "key": key, "hwid": hwid, "is_active": True, "bot_name": BENCH_BOT, "note": f"bench #{n}",
+                "created_at": now, "updated_at": now, "activated_at": now if hwid else None,
+            })
+            if len(chunk) == 10000:
+                conn.execute(License.__table__.insert(), chunk)
+                chunk = []
+        if chunk:
+            conn.execute(License.__table__.insert(), chunk)
+    return bound, free
+
+
+class Workload:
+    def __init__(self, mix, bound, free, invalid_ratio, rng):
+        self.endpoints, self.weights = zip(*mix.items())
+        self.bound = bound
+        self.free = free
+        self.invalid_ratio = invalid_ratio
+        self.rng = rng
+
+    def next_request(self):
+        endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+        if endpoint == "validate":
+            if self.rng.random() < self.invalid_ratio or not self.bound:
+                params = {"key": str(uuid.uuid4()).upper(), "hwid": "HWID-X"}
+            else:
+                key, hwid = self.rng.choice(self.bound)
+                params = {"key": key, "hwid": hwid}
+            return endpoint, "GET", "/validate", params
+        if endpoint == "activate":
+            if self.free:
+                key, hwid = self.free.pop(), f"HWID-A{self.rng.getrandbits(32)}"
+                self.bound.append((key, hwid))
+            else:
+                key, hwid = self.rng.choice(self.bound)
+            return endpoint, "POST", "/activate", {"key": key, "hwid": hwid}
+        if endpoint == "generate":
+            return endpoint, "POST", "/generate", {"note": "bench", "bot_name": BENCH_BOT}
+        if endpoint == "list":
+            return endpoint, "GET", "/licenses/list", {"limit": 100}
+        raise ValueError(f"Endpoint desconocido en --mix: {endpoint}")
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run(args, app, workload):
+    import httpx
+
+    latencies = {}
+    statuses = {}
+    measuring = False
+
+    async def worker(client, stop_at):
+        while time.perf_counter() < stop_at:
+            endpoint, method, path, params = workload.next_request()
+            start = time.perf_counter()
+            response = await client.request(method, path, params=params)
+            elapsed = time.perf_counter() - start
+            if measuring:
+                latencies.setdefault(endpoint, []).append(elapsed)
+                bucket = statuses.setdefault(endpoint, {})
+                bucket[response.status_code] = bucket.get(response.status_code, 0) + 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # Como el balanceador en producción: no se envía tráfico hasta que /ready responde 200
+            # (filtro de keys cargado y caché precargada); si no, los resultados dependen del momento
+            waited = time.perf_counter()
+            while (await client.get("/ready")).status_code != 200:
+                if time.perf_counter() - waited > READY_TIMEOUT:
+                    raise SystemExit(f"El servidor no estuvo listo en {READY_TIMEOUT} s")
+                await asyncio.sleep(0.1)
+            print(f"[*] Servidor listo en {time.perf_counter() - waited:.1f} s", flush=True)
+            if args.warmup > 0:
+                stop_at = time.perf_counter() + args.warmup
+                await asyncio.gather(*(worker(client, stop_at) for _ in range(args.concurrency)))
+            measuring = True
+            started = time.perf_counter()
+            stop_at = started + args.duration
+            await asyncio.gather(*(worker(client, stop_at) for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+
+    results = {}
+    for endpoint, values in sorted(latencies.items()):
+        values.sort()
+        results[endpoint] = {
+            "requests": len(values),
+            "rps": len(values) / elapsed,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "statuses": {str(code): n for code, n in sorted(statuses[endpoint].items())},
+        }
+    total = sum(r["requests"] for r in results.values())
+    return {"total_rps": total / elapsed, "elapsed_s": elapsed, "endpoints": results}
+
+
+def print_report(report):
+    print(f"\n{'endpoint':<10} {'reqs':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  status")
+    for endpoint, r in report["endpoints"].items():
+        print(f"{endpoint:<10} {r['requests']:>8} {r['rps']:>9.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f}  {r['statuses']}")
+    print(f"\nTotal: {report['total_rps']:.1f} req/s en {report['elapsed_s']:.1f}s")
+
+
+def compare(report, baseline_path, threshold):
+    """Imprime las diferencias con el resultado anterior. Devuelve False si hay regresión."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    ok = True
+    print(f"\nComparación con {baseline_path} (tolerancia {threshold:.0%}):")
+    for endpoint, r in report["endpoints"].items():
+        base = baseline["endpoints"].get(endpoint)
+        if not base:
+            continue
+        rps_change = r["rps"] / base["rps"] - 1 if base["rps"] else 0
+        p95_change = r["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0
+        regressed = rps_change < -threshold or p95_change > threshold
+        ok = ok and not regressed
+        flag = "  <-- REGRESIÓN" if regressed else ""
+        print(f"  {endpoint:<10} req/s {rps_change:+.1%}  p95 {p95_change:+.1%}{flag}")
+    return ok
+
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+    import models
+    models.init_db()
+
+    rng = random.Random(args.seed)
+    mix = {name: float(weight) for name, weight in (part.split("=") for part in args.mix.split(","))}
+    bound, free = seed(models, args.keys, args.bound_ratio, rng)
+
+    import main as server
+    workload = Workload(mix, bound, free, args.invalid_ratio, rng)
+    print(f"[bench] {models.DATABASE_URL} | async={models.DB_ASYNC} | concurrencia={args.concurrency} | {args.duration}s")
+    report = asyncio.run(run(args, server.app, workload))
+    report["config"] = {k: v for k, v in vars(args).items() if k not in ("json", "compare")}
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[bench] Resultados guardados en {args.json}")
+    if args.compare and not compare(report, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
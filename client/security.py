@@ -1,43 +1,313 @@
 import subprocess
 import requests
+import asyncio
+import inspect
 import sys
+import os
+import json
+import time
+import base64
+import hashlib
+import random
+import socket
+from collections import namedtuple
+from requests.adapters import HTTPAdapter
+
+try:
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+    from cryptography.exceptions import InvalidSignature
+except ImportError:  # Sin cryptography no hay validación offline: siempre se consulta al servidor
+    Ed25519PublicKey = None
 
 # URL del servidor local (cambiar a la IP del VPS en producción)
 SERVER_URL = "https://securitysoft.onrender.com"
 
-def get_hwid():
-    """Genera un ID único para la PC basado en el Serial Number del disco principal."""
+# Clave PÚBLICA Ed25519 del servidor (la que imprime `python server/lease.py`), pegada aquí.
+# Con ella el bot verifica el lease guardado en disco sin contactar al servidor.
+# Va fija en el código a propósito: si se pudiera cambiar desde el entorno, cualquiera
+# podría firmar sus propios leases. Vacía = sin validación offline.
+LEASE_PUBLIC_KEY = ""
+# Carpeta local donde se guardan los leases (fija, no configurable por el usuario)
+DATA_DIR = os.path.join(os.path.expanduser("~"), ".securitysoft")
+# Renovar el lease cuando quede menos de esta fracción de su duración
+LEASE_REFRESH_FRACTION = 0.25
+# HWID ya calculado en este equipo (evita lanzar wmic en cada arranque)
+HWID_CACHE_FILE = os.path.join(DATA_DIR, "hwid.json")
+
+# Reintentos ante errores de red, 429 y 5xx (backoff exponencial con jitter)
+REQUEST_TIMEOUT = (5, 10)  # (conexión, lectura) en segundos
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Heartbeat (LicenseHeartbeat): revalidación periódica mientras el bot corre
+HEARTBEAT_INTERVAL = 600  # segundos entre comprobaciones
+HEARTBEAT_JITTER = 0.2  # ± fracción aleatoria del intervalo (la flota no consulta a la vez)
+HEARTBEAT_GRACE = 1800  # segundos que se toleran errores del servidor sin lease vigente
+
+def _hwid_wmic():
+    """Windows: serial del disco principal (el HWID original del sistema)."""
+    # Usamos wmic para obtener el serial del disco de Windows
+    output = subprocess.check_output(
+        ["wmic", "diskdrive", "get", "serialnumber"],
+        stderr=subprocess.DEVNULL,
+        creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),
+    ).decode().split()
+    # Retornamos el primer serial que encontremos después del encabezado "SerialNumber"
+    for item in output:
+        if item.strip() and item != "SerialNumber":
+            return item.strip()
+    return None
+
+def _hwid_powershell():
+    """Windows 11 sin wmic: mismo serial vía CIM."""
+    output = subprocess.check_output(
+        ["powershell", "-NoProfile", "-Command", "(Get-CimInstance Win32_DiskDrive | Select-Object -First 1).SerialNumber"],
+        stderr=subprocess.DEVNULL,
+        creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),
+    ).decode().split()
+    return output[0] if output else None
+
+def _read_first_line(*paths):
+    for path in paths:
+        try:
+            with open(path) as f:
+                value = f.readline().strip()
+            if value:
+                return value
+        except OSError:
+            continue
+    return None
+
+def _hwid_machine_id():
+    """Linux: identificador de la instalación (systemd / dbus)."""
+    return _read_first_line("/etc/machine-id", "/var/lib/dbus/machine-id")
+
+def _hwid_dmi():
+    """Linux: UUID de la placa (normalmente solo legible como root)."""
+    return _read_first_line("/sys/class/dmi/id/product_uuid", "/sys/class/dmi/id/board_serial")
+
+def _hwid_ioreg():
+    """macOS: IOPlatformUUID."""
+    output = subprocess.check_output(["ioreg", "-rd1", "-c", "IOPlatformExpertDevice"], stderr=subprocess.DEVNULL).decode()
+    for line in output.splitlines():
+        if "IOPlatformUUID" in line:
+            return line.split("=")[-1].strip().strip('"')
+    return None
+
+# Proveedores de HWID por plataforma, en orden de preferencia.
+# Se pueden añadir otros con register_hwid_provider().
+HWID_PROVIDERS = {
+    "win32": [_hwid_wmic, _hwid_powershell],
+    "linux": [_hwid_machine_id, _hwid_dmi],
+    "darwin": [_hwid_ioreg],
+}
+# Proveedores lentos (lanzan wmic/PowerShell): su resultado se guarda en hwid.json.
+# El resto se recalcula en cada arranque, así copiar hwid.json a otro equipo no basta.
+HWID_CACHED_PROVIDERS = {_hwid_wmic, _hwid_powershell}
+
+def register_hwid_provider(provider, platform=None, first=True, cached=False):
+    """Registra una función sin argumentos que devuelve el HWID (o None si no aplica).
+
+    cached=True si es lenta: su resultado se guarda en disco entre arranques.
+    """
+    providers = HWID_PROVIDERS.setdefault(platform or sys.platform, [])
+    if first:
+        providers.insert(0, provider)
+    else:
+        providers.append(provider)
+    if cached:
+        HWID_CACHED_PROVIDERS.add(provider)
+
+_hwid = None
+
+def _read_hwid_cache(provider):
     try:
-        # Usamos wmic para obtener el serial del disco de Windows
-        cmd = "wmic diskdrive get serialnumber"
-        output = subprocess.check_output(cmd, shell=True).decode().split()
-        # Retornamos el primer serial que encontremos después del encabezado "SerialNumber"
-        for item in output:
-            if item.strip() and item != "SerialNumber":
-                return item.strip()
-    except Exception as e:
-        print(f"Error generando HWID: {e}")
+        with open(HWID_CACHE_FILE) as f:
+            data = json.load(f)
+        # La caché solo vale en el equipo y con el proveedor que la generaron
+        if data.get("host") == socket.gethostname() and data.get("provider") == provider.__name__:
+            return data.get("hwid")
+    except (OSError, ValueError, AttributeError):
+        pass
+    return None
+
+def _write_hwid_cache(provider, hwid):
+    try:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(HWID_CACHE_FILE, "w") as f:
+            json.dump({"hwid": hwid, "host": socket.gethostname(), "provider": provider.__name__}, f)
+    except OSError:
+        pass
+
+def get_hwid():
+    """Devuelve un ID único para la PC (en Windows, el Serial Number del disco principal).
+
+    Se calcula una vez por proceso. El resultado de wmic/PowerShell se guarda además
+    en un pequeño archivo local, así los siguientes arranques no lanzan procesos externos.
+    """
+    global _hwid
+    if _hwid:
+        return _hwid
+
+    for provider in HWID_PROVIDERS.get(sys.platform, []):
+        cached = provider in HWID_CACHED_PROVIDERS
+        hwid = _read_hwid_cache(provider) if cached else None
+        if hwid:
+            break
+        try:
+            hwid = provider()
+        except Exception:
+            hwid = None
+        if hwid:
+            if cached:
+                _write_hwid_cache(provider, hwid)
+            break
+    else:
+        # Valor histórico: el servidor deja revincular una vez las keys ligadas a él
+        print("Error generando HWID: ningún proveedor disponible")
         return "UNKNOWN_HWID"
 
+    _hwid = hwid
+    return hwid
+
+_session = None
+
+def get_session():
+    """Sesión HTTP compartida: reutiliza la conexión TLS (keep-alive) entre llamadas."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=10)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+def _retry_delay(attempt, response=None):
+    if response is not None and response.headers.get("Retry-After", "").isdigit():
+        return min(int(response.headers["Retry-After"]), RETRY_MAX_DELAY)
+    # Full jitter: evita que muchos bots reintenten a la vez
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+def request_server(method, path, **kwargs):
+    """Petición al servidor de licencias con reintentos ante fallos transitorios."""
+    kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+    for attempt in range(RETRY_ATTEMPTS):
+        last_attempt = attempt == RETRY_ATTEMPTS - 1
+        try:
+            response = get_session().request(method, f"{SERVER_URL}{path}", **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if last_attempt:
+                raise
+            time.sleep(_retry_delay(attempt))
+            continue
+        if response.status_code not in RETRY_STATUSES or last_attempt:
+            return response
+        time.sleep(_retry_delay(attempt, response))
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _lease_path(license_key):
+    name = hashlib.sha256(license_key.encode()).hexdigest()[:24]
+    return os.path.join(DATA_DIR, f"lease_{name}.tok")
+
+def verify_lease(token, license_key, hwid, now=None):
+    """Verifica firma, key, HWID y vigencia de un lease. Devuelve el payload o None."""
+    if Ed25519PublicKey is None or not LEASE_PUBLIC_KEY or not token:
+        return None
+    try:
+        body, signature = token.split(".")
+        public_key = Ed25519PublicKey.from_public_bytes(base64.b64decode(LEASE_PUBLIC_KEY))
+        public_key.verify(_b64decode(signature), body.encode())
+        payload = json.loads(_b64decode(body))
+        now = time.time() if now is None else now
+        if payload["k"] != license_key or payload["h"] != hwid:
+            return None
+        if payload["lex"] <= now or (payload["exp"] is not None and payload["exp"] <= now):
+            return None
+    except (ValueError, KeyError, TypeError, InvalidSignature):
+        return None
+    return payload
+
+def load_lease(license_key, hwid):
+    """Lee y verifica el lease guardado en disco para esta key."""
+    try:
+        with open(_lease_path(license_key)) as f:
+            return verify_lease(f.read().strip(), license_key, hwid)
+    except OSError:
+        return None
+
+def save_lease(license_key, token):
+    try:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(_lease_path(license_key), "w") as f:
+            f.write(token)
+    except OSError as e:
+        print(f"[-] No se pudo guardar el lease: {e}")
+
+def delete_lease(license_key):
+    try:
+        os.remove(_lease_path(license_key))
+    except OSError:
+        pass
+
+def _lease_is_fresh(payload):
+    """True si aún queda suficiente lease como para no consultar al servidor."""
+    remaining = payload["lex"] - time.time()
+    return remaining > (payload["lex"] - payload["iat"]) * LEASE_REFRESH_FRACTION
+
+# Resultado de una consulta al servidor. transient=True: no se pudo decidir (red, 429, 5xx)
+LicenseStatus = namedtuple("LicenseStatus", ["valid", "reason", "message", "transient"])
+
+def validate_license(license_key, hwid=None):
+    """Consulta /validate (sin mirar el lease local) y guarda o borra el lease según la respuesta."""
+    hwid = hwid or get_hwid()
+    try:
+        response = request_server("GET", "/validate", params={"key": license_key, "hwid": hwid})
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        return LicenseStatus(False, "unreachable", "No se pudo conectar con el servidor de licencias", True)
+
+    # Si el status es 200, la licencia es válida o se acaba de auto-activar
+    if response.status_code == 200:
+        data = response.json()
+        if data.get("lease"):
+            save_lease(license_key, data["lease"])
+        return LicenseStatus(True, None, data.get("message"), False)
+
+    # Si el status es 403, la licencia es inválida o está bloqueada
+    if response.status_code == 403:
+        delete_lease(license_key)
+        error_data = response.json().get("detail", {})
+        return LicenseStatus(False, error_data.get("reason"), error_data.get("message", "Acceso denegado"), False)
+
+    return LicenseStatus(False, "server_error", f"Status {response.status_code}", True)
+
 def check_license(license_key):
-    """Valida la licencia con el servidor de forma estricta."""
+    """Valida la licencia: primero con el lease firmado en disco, si no con el servidor.
+
+    Solo se contacta al servidor cuando no hay lease o está cerca de vencer. Si el
+    servidor no responde pero el lease sigue vigente, el bot puede arrancar igual.
+    """
     hwid = get_hwid()
+
+    lease = load_lease(license_key, hwid)
+    if lease and _lease_is_fresh(lease):
+        print("[+] Licencia verificada (lease local)")
+        return True
     
     try:
-        response = requests.get(f"{SERVER_URL}/validate", params={"key": license_key, "hwid": hwid}, timeout=10)
-        
-        # Si el status es 200, la licencia es válida o se acaba de auto-activar
-        if response.status_code == 200:
-            data = response.json()
-            print(f"[+] {data.get('message')}")
+        status = validate_license(license_key, hwid)
+
+        if status.valid:
+            print(f"[+] {status.message}")
             print(f"[+] HWID Vinculado: {hwid}")
             return True
-        
-        # Si el status NO es 200 (ej: 403), la licencia es inválida o está bloqueada
-        if response.status_code == 403:
-            error_data = response.json().get("detail", {})
-            reason = error_data.get("reason")
-            message = error_data.get("message", "Acceso denegado")
+
+        if not status.transient:
+            reason = status.reason
+            message = status.message
             
             if reason == "key_disabled":
                 print(f"[-] LICENCIA BLOQUEADA: {message}")
@@ -52,15 +322,51 @@ def check_license(license_key):
                 print(f"[-] ERROR: {message}")
             return False
 
-        print(f"[-] Error inesperado del servidor (Status {response.status_code})")
+        if status.reason == "unreachable":
+            print("[-] Error: No se pudo conectar con el servidor de licencias. Verifica tu internet.")
+        else:
+            print(f"[-] Error inesperado del servidor ({status.message})")
+        return _offline_fallback(lease)
+
+    except Exception as e:
+        print(f"[-] Error inesperado en validación: {e}")
         return False
 
-    except requests.exceptions.ConnectionError:
+def _offline_fallback(lease):
+    """Servidor caído o frío: se permite arrancar mientras el lease firmado siga vigente."""
+    if lease:
+        print("[!] Servidor no disponible, usando lease local hasta su vencimiento.")
+        return True
+    return False
+
+def check_licenses_batch(pairs):
+    """Valida varias licencias en una sola petición HTTP (supervisor de una flota de bots).
+
+    pairs: lista de (key, hwid). Si hwid es None se usa el HWID de este equipo.
+    Devuelve una lista de dicts con "key", "valid" y, si falla, "reason" y "message",
+    en el mismo orden. Devuelve None si no se pudo contactar con el servidor.
+    """
+    local_hwid = None
+    items = []
+    for key, hwid in pairs:
+        if hwid is None:
+            if local_hwid is None:
+                local_hwid = get_hwid()
+            hwid = local_hwid
+        items.append({"key": key, "hwid": hwid})
+
+    try:
+        response = request_server("POST", "/validate/batch", json=items, timeout=(5, 30))
+        if response.status_code == 200:
+            return response.json()["results"]
+        print(f"[-] Error inesperado del servidor (Status {response.status_code})")
+        return None
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
         print("[-] Error: No se pudo conectar con el servidor de licencias. Verifica tu internet.")
-        return False
+        return None
     except Exception as e:
         print(f"[-] Error inesperado en validación: {e}")
-        return False
+        return None
 
 def protect_bot(license_key):
     """Función para llamar al inicio de tus bots."""
@@ -69,6 +375,112 @@ def protect_bot(license_key):
         input("Presiona Enter para salir...")
         sys.exit()
 
+# --- BOTS CON ASYNCIO ---
+
+async def check_license_async(license_key):
+    """check_license sin bloquear el event loop: la petición corre en un hilo aparte."""
+    return await asyncio.to_thread(check_license, license_key)
+
+async def validate_license_async(license_key, hwid=None):
+    return await asyncio.to_thread(validate_license, license_key, hwid)
+
+class LicenseHeartbeat:
+    """Revalida la licencia en segundo plano mientras el bot corre, sin bloquear su loop.
+
+    Cada `interval` segundos (± `jitter`, para que una flota que arrancó a la vez no
+    consulte a la vez) pregunta a /validate. Si la key se bloquea, expira o cambia de
+    equipo llama a on_revoked(status) y se detiene. Los errores del servidor (caída,
+    5xx, 429) no revocan mientras haya un lease vigente o no hayan pasado `grace`
+    segundos desde la última validación correcta.
+
+    on_revoked puede ser una función o una corrutina.
+    """
+
+    def __init__(self, license_key, on_revoked, interval=HEARTBEAT_INTERVAL, jitter=HEARTBEAT_JITTER, grace=HEARTBEAT_GRACE):
+        self.license_key = license_key
+        self.on_revoked = on_revoked
+        self.interval = interval
+        self.jitter = jitter
+        self.grace = grace
+        self.last_valid = time.monotonic()
+        self.last_status = None
+        self._task = None
+
+    def start(self):
+        """Lanza el heartbeat como tarea del loop actual. Devuelve self."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _delay(self, base):
+        return base * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def _run(self):
+        delay = self.interval
+        while True:
+            await asyncio.sleep(self._delay(delay))
+            try:
+                status = await validate_license_async(self.license_key)
+            except Exception as e:
+                status = LicenseStatus(False, "client_error", str(e), True)
+            self.last_status = status
+
+            if status.valid:
+                self.last_valid = time.monotonic()
+                delay = self.interval
+                continue
+
+            if status.transient:
+                if not self._within_grace():
+                    await self._revoked(status)
+                    return
+                # Servidor con problemas: reintentar antes, sin esperar un intervalo entero
+                delay = min(self.interval, max(self.grace / 4, 5))
+                continue
+
+            await self._revoked(status)
+            return
+
+    def _within_grace(self):
+        if time.monotonic() - self.last_valid <= self.grace:
+            return True
+        # El lease firmado sigue siendo una autorización válida sin servidor
+        return load_lease(self.license_key, get_hwid()) is not None
+
+    async def _revoked(self, status):
+        try:
+            result = self.on_revoked(status)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            print(f"[-] Error en on_revoked: {e}")
+
+def _exit_on_revoked(status):
+    print(f"[-] LICENCIA REVOCADA: {status.message}")
+    print("[-] El programa se cerrará.")
+    # Desde un callback del loop (no desde la tarea) el SystemExit sale limpio de asyncio.run
+    asyncio.get_running_loop().call_soon(sys.exit, 1)
+
+async def protect_bot_async(license_key, on_revoked=_exit_on_revoked, **heartbeat_options):
+    """Versión asyncio de protect_bot: valida al inicio y deja un LicenseHeartbeat corriendo.
+
+    Por defecto, si la licencia se revoca con el bot en marcha, el proceso termina.
+    Devuelve el heartbeat (para llamar a stop() al cerrar el bot).
+    """
+    if not await check_license_async(license_key):
+        print("[-] Acceso denegado. El programa se cerrará.")
+        raise SystemExit(1)
+    return LicenseHeartbeat(license_key, on_revoked, **heartbeat_options).start()
+
 # Ejemplo de uso (esto iría al inicio de tu bot real)
 if __name__ == "__main__":
     print("--- INICIANDO BOT PROTEGIDO ---")
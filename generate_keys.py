@@ -1,3 +1,5 @@
+import argparse
+import sys
 import requests
 
 # URL del servidor local
@@ -14,7 +16,47 @@ def generate(note):
     except Exception as e:
         print(f"[-] Error de conexión: {e}. ¿Está corriendo el servidor?")
 
+def generate_bulk(count, bot_name, duration_days, note_prefix, fmt, out_path):
+    """Genera `count` claves con /generate/bulk y las guarda a medida que llegan."""
+    params = {"count": count, "bot_name": bot_name, "duration_days": duration_days, "format": fmt}
+    if note_prefix:
+        params["note_prefix"] = note_prefix
+    try:
+        with requests.post(f"{SERVER_URL}/generate/bulk", params=params, stream=True, timeout=(10, 300)) as response:
+            if response.status_code != 200:
+                print(f"[-] Error al generar claves: {response.text}", file=sys.stderr)
+                return False
+            response.encoding = "utf-8"
+            out = open(out_path, "w", encoding="utf-8", newline="") if out_path else sys.stdout
+            try:
+                for chunk in response.iter_content(chunk_size=65536, decode_unicode=True):
+                    out.write(chunk)
+            finally:
+                if out_path:
+                    out.close()
+        if out_path:
+            print(f"[+] {count} claves guardadas en {out_path}", file=sys.stderr)
+        return True
+    except Exception as e:
+        print(f"[-] Error de conexión: {e}. ¿Está corriendo el servidor?", file=sys.stderr)
+        return False
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generador de claves de seguridad. Sin argumentos funciona en modo interactivo.")
+    parser.add_argument("--count", type=int, help="Cantidad de claves a generar (modo lote)")
+    parser.add_argument("--bot", default="Generic Bot", help="Bot / producto")
+    parser.add_argument("--days", type=int, default=0, help="Duración en días (0 = indefinida)")
+    parser.add_argument("--note-prefix", help="Prefijo de la nota; cada clave recibe '<prefijo> #N'")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--out", help="Archivo de salida (por defecto, la consola)")
+    parser.add_argument("--server", default=SERVER_URL, help="URL del servidor de licencias")
+    args = parser.parse_args()
+    SERVER_URL = args.server
+
+    if args.count:
+        ok = generate_bulk(args.count, args.bot, args.days, args.note_prefix, args.format, args.out)
+        sys.exit(0 if ok else 1)
+
     print("--- GENERADOR DE CLAVES DE SEGURIDAD ---")
     cliente = input("Nombre del cliente o nota: ")
     generate(cliente)
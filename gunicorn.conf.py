@@ -0,0 +1,59 @@
+"""Configuración de gunicorn para producción: varios workers de uvicorn.
+
+    gunicorn -c gunicorn.conf.py server.main:app
+
+Todo se ajusta con variables de entorno (ver README_ES.md, sección 6).
+"""
+import glob
+import os
+import sys
+import tempfile
+
+from sqlalchemy import create_engine
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn_worker.UvicornWorker"
+# Por defecto 2: en un contenedor cpu_count() es el del host, y cada worker abre su
+# propio pool (DB_POOL_SIZE + DB_MAX_OVERFLOW conexiones)
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# Los workers heredan el entorno: el servidor lo usa para repartir los rate limits
+# y activar el registro de cambios compartido (CHANGE_LOG)
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Reinicia cada worker tras N peticiones (0 = nunca) para acotar fugas de memoria
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+# Sin preload: cada worker abre su propio pool de conexiones a la DB tras el fork
+preload_app = False
+accesslog = "-" if os.getenv("GUNICORN_ACCESS_LOG") else None
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+
+
+def on_starting(server):
+    """Crea/actualiza el esquema una sola vez en el master, antes de arrancar los workers.
+
+    Si cada worker lo hiciera a la vez chocarían con columnas/índices duplicados; si falla
+    aquí, gunicorn no arranca y el error sale una sola vez en el log.
+    """
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "server"))
+    import models
+
+    if models.env_flag("DB_SCHEMA_CHECK", "1"):
+        # Engine propio y desechable: el master no debe heredar conexiones a los workers
+        engine = create_engine(models.DATABASE_URL, connect_args=models.CONNECT_ARGS)
+        try:
+            models.create_schema(engine)
+        finally:
+            engine.dispose()
+        server.log.info("Esquema de la base de datos al día")
+    os.environ["DB_SCHEMA_CHECK"] = "0"
+
+    # Métricas: cada worker vuelca las suyas aquí y /metrics devuelve la suma de todos
+    metrics_dir = os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="authkey-metrics-"))
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, "*.json")):
+        os.remove(path)
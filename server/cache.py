@@ -0,0 +1,74 @@
+from collections import OrderedDict, namedtuple
+import threading
+import time
+import os
+
+# Estado mínimo de una licencia necesario para responder /validate sin ir a la DB
+LicenseState = namedtuple("LicenseState", ["is_active", "hwid", "expires_at"])
+
+
+class LicenseCache:
+    """Caché LRU acotada con TTL, indexada por key de licencia.
+
+    Es segura entre hilos: los endpoints sync corren en el threadpool de Starlette.
+    """
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            state, stored_at = item
+            if time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return state
+
+    def generation(self):
+        """Contador de invalidaciones: se lee antes de consultar la DB y se pasa a set()."""
+        return self._generation
+
+    def set(self, key, state, generation=None):
+        """Guarda el estado. Con generation, no hace nada si desde entonces hubo una
+        invalidación: lo leído de la DB podría ser anterior a ese cambio."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._data[key] = (state, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+license_cache = LicenseCache(
+    max_size=int(os.getenv("LICENSE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("LICENSE_CACHE_TTL", "300")),
+)
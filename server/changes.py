@@ -0,0 +1,108 @@
+import datetime
+import json
+import os
+import time
+import uuid
+
+from sqlalchemy import func
+
+import models
+
+# Procesos que atienden peticiones (gunicorn -w N). Lo fija gunicorn.conf.py
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+# Registro compartido de cambios; imprescindible con más de un worker o réplica
+CHANGE_LOG = models.env_flag("CHANGE_LOG", "1" if WORKERS > 1 else "0")
+# Segundos entre consultas al registro: retraso máximo hasta que otro worker ve un bloqueo
+CHANGE_POLL_INTERVAL = float(os.getenv("CHANGE_POLL_INTERVAL", "1"))
+CHANGE_LOG_RETENTION = datetime.timedelta(hours=1)
+# Tiempo que se espera a un id que falta (transacción aún abierta) antes de darlo por perdido
+GAP_TIMEOUT = 30
+POLL_BATCH = 1000
+
+# Identifica a este proceso para no reaplicar sus propios cambios
+WORKER_ID = uuid.uuid4().hex
+
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"No serializable: {value!r}")
+
+
+class ChangeFeed:
+    """Lee license_changes por id creciente para enterarse de lo que hicieron otros workers.
+
+    Los ids pueden confirmarse fuera de orden (dos transacciones a la vez), así que no
+    basta con recordar el mayor id visto: se guarda el último id sin huecos (floor) y los
+    vistos por encima; un hueco que no se llena en GAP_TIMEOUT segundos es un rollback.
+    """
+
+    def __init__(self):
+        self.floor = None
+        self._seen = set()
+        self._gap_since = None
+        self._last_prune = None
+
+    @staticmethod
+    def record(db, key, event):
+        """Añade el cambio a la transacción del llamador (se confirma con su commit)."""
+        db.add(models.LicenseChange(origin=WORKER_ID, key=key, event=json.dumps(event, default=_json_default)))
+
+    def poll(self, db):
+        """Devuelve [(key, event)] nuevos de otros workers. Se ejecuta con run_db."""
+        Change = models.LicenseChange
+        if self.floor is None:
+            # Al arrancar no se reaplica el historial: todo está ya en la DB
+            self.floor = db.query(func.max(Change.id)).scalar() or 0
+            return []
+
+        rows = (
+            db.query(Change.id, Change.origin, Change.key, Change.event)
+            .filter(Change.id > self.floor)
+            .order_by(Change.id)
+            .limit(POLL_BATCH)
+            .all()
+        )
+        changes = []
+        for row in rows:
+            if row.id in self._seen:
+                continue
+            self._seen.add(row.id)
+            if row.origin != WORKER_ID:
+                changes.append((row.key, json.loads(row.event)))
+        self._advance()
+        self._prune(db)
+        return changes
+
+    def _advance(self):
+        now = time.monotonic()
+        advanced = False
+        while self._seen:
+            following = self.floor + 1
+            if following in self._seen:
+                self._seen.discard(following)
+                self.floor = following
+                advanced = True
+            elif self._gap_since is not None and now - self._gap_since > GAP_TIMEOUT:
+                # Hueco demasiado viejo: se salta hasta el siguiente id visto
+                self.floor = min(self._seen) - 1
+                self._gap_since = None
+            else:
+                break
+        if not self._seen:
+            self._gap_since = None
+        elif advanced or self._gap_since is None:
+            # floor se detuvo en un hueco nuevo: su plazo empieza ahora
+            self._gap_since = now
+
+    def _prune(self, db):
+        now = datetime.datetime.utcnow()
+        if self._last_prune and now - self._last_prune < datetime.timedelta(minutes=10):
+            return
+        self._last_prune = now
+        Change = models.LicenseChange
+        db.query(Change).filter(Change.created_at < now - CHANGE_LOG_RETENTION).delete(synchronize_session=False)
+        db.commit()
+
+
+change_feed = ChangeFeed()
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+
+
+class EventBus:
+    """Pub/sub en proceso para notificar cambios de licencias al panel (/events).
+
+    publish() se puede llamar desde cualquier hilo (threadpool o event loop); cada
+    suscriptor recibe los eventos en su propia asyncio.Queue. `version` cuenta los
+    cambios publicados y sirve de ETag para el listado.
+    """
+
+    def __init__(self, max_queue=500):
+        self.max_queue = max_queue
+        self.version = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers = {sub for sub in self._subscribers if sub[1] is not queue}
+
+    def publish(self, event):
+        with self._lock:
+            self.version += 1
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, event)
+            except RuntimeError:
+                # Loop cerrado: el suscriptor ya no existe
+                self.unsubscribe(queue)
+
+    @staticmethod
+    def _put(queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Cliente demasiado lento: vaciar y pedirle que resincronice con el modo delta
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"type": "resync"})
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+event_bus = EventBus()
@@ -0,0 +1,68 @@
+"""Tokens de arrendamiento (lease) firmados para validar licencias sin conexión.
+
+El token vincula key, HWID, vencimiento de la licencia y un periodo de lease corto.
+Se firma con Ed25519: el servidor guarda la clave privada (LEASE_SIGNING_KEY) y el
+cliente solo lleva la pública, así que un cliente crackeado no puede fabricar tokens.
+
+Formato: base64url(payload JSON) + "." + base64url(firma)
+
+Generar un par de claves:
+    python server/lease.py
+"""
+import base64
+import datetime
+import json
+import os
+import time
+
+# Clave privada Ed25519 en base64 (32 bytes). Sin ella no se emiten leases.
+LEASE_SIGNING_KEY = os.getenv("LEASE_SIGNING_KEY")
+# Duración del lease: cuánto puede funcionar un bot sin volver a consultar al servidor
+LEASE_SECONDS = int(os.getenv("LEASE_SECONDS", "86400"))
+
+_signer = None
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _get_signer():
+    global _signer
+    if _signer is None and LEASE_SIGNING_KEY:
+        from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+        _signer = Ed25519PrivateKey.from_private_bytes(base64.b64decode(LEASE_SIGNING_KEY))
+    return _signer
+
+
+def issue_lease(key, hwid, expires_at):
+    """Devuelve un token firmado para (key, hwid) o None si no hay clave de firma configurada."""
+    signer = _get_signer()
+    if signer is None:
+        return None
+
+    now = int(time.time())
+    license_exp = None
+    if expires_at:
+        license_exp = int(expires_at.replace(tzinfo=datetime.timezone.utc).timestamp())
+    lease_exp = now + LEASE_SECONDS
+    if license_exp is not None:
+        lease_exp = min(lease_exp, license_exp)
+
+    payload = {"k": key, "h": hwid, "exp": license_exp, "iat": now, "lex": lease_exp}
+    body = _b64encode(json.dumps(payload, separators=(",", ":")).encode())
+    return body + "." + _b64encode(signer.sign(body.encode()))
+
+
+if __name__ == "__main__":
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+    from cryptography.hazmat.primitives import serialization
+
+    private_key = Ed25519PrivateKey.generate()
+    private_raw = private_key.private_bytes(
+        serialization.Encoding.Raw, serialization.PrivateFormat.Raw, serialization.NoEncryption()
+    )
+    public_raw = private_key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    print("LEASE_SIGNING_KEY (servidor, secreta):", base64.b64encode(private_raw).decode())
+    print("LEASE_PUBLIC_KEY  (cliente, pública): ", base64.b64encode(public_raw).decode())
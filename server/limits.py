@@ -0,0 +1,139 @@
+from collections import OrderedDict
+import hashlib
+import math
+import os
+import threading
+import time
+
+
+class BloomFilter:
+    """Filtro de Bloom: "seguro que no está" o "quizás está", con ~1 bit por elemento y hash."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(1, capacity)
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class KeyFilter:
+    """Conjunto aproximado de las keys existentes para rechazar keys inventadas sin ir a la DB.
+
+    Falla "abierto": hasta que se carga (o si se llena por encima de su capacidad)
+    todas las keys se consideran posibles y se consultan en la DB como siempre.
+    Las keys borradas siguen dentro hasta la próxima recarga; solo cuestan una consulta.
+    """
+
+    def __init__(self, error_rate=0.001):
+        self.error_rate = error_rate
+        self._bloom = None
+        self._lock = threading.Lock()
+        self._added_while_loading = None
+        self.rejected = 0
+
+    @property
+    def ready(self):
+        return self._bloom is not None
+
+    def begin_load(self):
+        """Llamar antes de leer las keys de la DB: las altas posteriores no se pierden."""
+        with self._lock:
+            self._added_while_loading = set()
+
+    def load(self, keys, expected):
+        """Reconstruye el filtro con todas las keys; se reserva el doble para altas futuras."""
+        bloom = BloomFilter(max(2 * expected, 100000), self.error_rate)
+        for key in keys:
+            bloom.add(key)
+        with self._lock:
+            for key in self._added_while_loading or ():
+                bloom.add(key)
+            self._added_while_loading = None
+            self._bloom = bloom
+
+    def add(self, key):
+        with self._lock:
+            if self._added_while_loading is not None:
+                self._added_while_loading.add(key)
+            if self._bloom is not None:
+                self._bloom.add(key)
+                if self._bloom.count > self._bloom.capacity:
+                    # Demasiadas altas: la tasa de falsos positivos se dispara, mejor desactivar
+                    self._bloom = None
+
+    def might_exist(self, key):
+        bloom = self._bloom
+        if bloom is None or key in bloom:
+            return True
+        self.rejected += 1
+        return False
+
+
+class TokenBucketLimiter:
+    """Limitador token bucket por clave (IP o license key), con memoria acotada (LRU)."""
+
+    def __init__(self, rate, burst, max_entries=100000):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def allow(self, name, cost=1):
+        """Consume `cost` tokens. Devuelve 0 si se permite, o los segundos a esperar si no.
+
+        Un coste mayor que la ráfaga nunca cabría: se cobra como la ráfaga entera.
+        """
+        if not self.enabled:
+            return 0
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(name, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0
+            else:
+                wait = (cost - tokens) / self.rate
+                self.limited += 1
+            self._buckets[name] = (tokens, now)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+key_filter = KeyFilter()
+
+# Cada worker lleva sus propios buckets: el límite configurado se reparte entre ellos
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+# RATE=0 desactiva el limitador correspondiente
+ip_limiter = TokenBucketLimiter(
+    rate=float(os.getenv("RATE_LIMIT_IP_RATE", "20")) / WORKERS,
+    burst=float(os.getenv("RATE_LIMIT_IP_BURST", "200")) / WORKERS,
+)
+license_limiter = TokenBucketLimiter(
+    rate=float(os.getenv("RATE_LIMIT_KEY_RATE", "1")) / WORKERS,
+    burst=float(os.getenv("RATE_LIMIT_KEY_BURST", "10")) / WORKERS,
+)
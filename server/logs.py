@@ -0,0 +1,30 @@
+import atexit
+import logging
+import os
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+log = logging.getLogger("authkey")
+
+_listener = None
+
+
+def setup_logging():
+    """Logging con niveles y sin bloquear: los endpoints solo encolan el registro y un
+    hilo aparte lo escribe en stdout. Nivel configurable con LOG_LEVEL."""
+    global _listener
+    if _listener is not None:
+        return log
+
+    queue = SimpleQueue()
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+    _listener = QueueListener(queue, stream)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    log.addHandler(QueueHandler(queue))
+    log.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    log.propagate = False
+    return log
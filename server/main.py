@@ -1,9 +1,24 @@
 from fastapi import FastAPI, Depends, HTTPException, Request
-from fastapi.responses import HTMLResponse
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.exception_handlers import http_exception_handler
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, StreamingResponse, Response
+from pydantic import BaseModel
+from sqlalchemy import insert, update, or_, and_, func
+from typing import List
+from contextlib import asynccontextmanager, AsyncExitStack
 import datetime
-import webbrowser
-from threading import Timer
+import base64
+import hashlib
+import asyncio
+import json
+import csv
+import io
+import collections
+import math
+import time
+import tempfile
 import sys
 import os
 
@@ -11,24 +26,372 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import models
 import uuid
+from cache import license_cache, LicenseState
+from events import event_bus
+from lease import issue_lease
+from limits import key_filter, ip_limiter, license_limiter
+import metrics
+from logs import setup_logging
+from tracking import usage_tracker, TRACKING_FLUSH_INTERVAL
+from stats import license_stats, STATS_RECONCILE_INTERVAL
+from changes import change_feed, CHANGE_LOG, CHANGE_POLL_INTERVAL
+import transfer
 
-app = FastAPI(title="AuthKey System Dashboard")
+log = setup_logging()
 
-# Inicializar base de datos
-models.init_db()
+@asynccontextmanager
+async def lifespan(app):
+    # Engines y esquema se preparan aquí, no al importar; el calentamiento sigue en segundo plano
+    await run_in_threadpool(models.init_db, DB_SCHEMA_CHECK)
+    _instrument_engines()
+    tasks = [
+        asyncio.create_task(_warm_up()),
+        asyncio.create_task(_key_filter_loop()),
+        asyncio.create_task(_tracking_loop()),
+        asyncio.create_task(_stats_loop()),
+    ]
+    if CHANGE_LOG:
+        tasks.append(asyncio.create_task(_change_loop()))
+    if metrics.METRICS_DIR:
+        tasks.append(asyncio.create_task(_metrics_loop()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await _flush_tracking()
+    if metrics.METRICS_DIR:
+        # Último volcado: los contadores de este worker siguen sumando tras su reinicio
+        await run_in_threadpool(metrics.registry.dump)
 
-# Dependencia para la sesión de DB
-def get_db():
+app = FastAPI(title="AuthKey System Dashboard", lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
+# /events (text/event-stream) queda excluido de la compresión por Starlette
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+# Máximo de pares (key, hwid) aceptados por /validate/batch
+VALIDATE_BATCH_MAX = int(os.getenv("VALIDATE_BATCH_MAX", "1000"))
+# Generación masiva: máximo de keys por petición y filas por transacción
+BULK_GENERATE_MAX = int(os.getenv("BULK_GENERATE_MAX", "50000"))
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+# Cada cuántos segundos se reconstruye el filtro de keys existentes (limpia las borradas)
+KEY_FILTER_RELOAD = float(os.getenv("KEY_FILTER_RELOAD", "3600"))
+# Detrás de un proxy (Render) la IP real del bot viene en X-Forwarded-For
+TRUST_PROXY_HEADERS = models.env_flag("TRUST_PROXY_HEADERS", "1" if os.getenv("RENDER") else "0")
+
+# Comprobar/crear tablas e índices al arrancar; 0 si el esquema ya está al día (arranque más rápido)
+DB_SCHEMA_CHECK = models.env_flag("DB_SCHEMA_CHECK", "1")
+# Calentamiento: conexiones del pool abiertas de antemano y licencias recientes precargadas en caché
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", str(models.POOL_OPTIONS["pool_size"])))
+WARMUP_KEYS = int(os.getenv("WARMUP_KEYS", str(license_cache.max_size)))
+
+# Sesión de DB (AsyncSession con DB_ASYNC=1, Session síncrona si no)
+@asynccontextmanager
+async def db_session():
+    if models.DB_ASYNC:
+        async with models.AsyncSessionLocal() as db:
+            yield db
+        return
     db = models.SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await run_in_threadpool(db.close)
+
+# Dependencia para la sesión de DB
+async def get_db():
+    async with db_session() as db:
+        yield db
+
+def _timed_call(db, fn, *args):
+    # Mide la espera por una conexión del pool antes de la primera consulta de la transacción
+    if not db.in_transaction():
+        start = time.perf_counter()
+        db.connection()
+        metrics.DB_POOL_WAIT.observe(time.perf_counter() - start)
+    return fn(db, *args)
+
+async def run_db(db, fn, *args):
+    """Ejecuta fn(session, *args) sin bloquear el event loop.
+
+    En modo async corre sobre la conexión asyncpg/aiosqlite mediante run_sync;
+    en modo síncrono se delega al threadpool de Starlette como antes.
+    """
+    if models.DB_ASYNC:
+        if not db.in_transaction():
+            start = time.perf_counter()
+            await db.connection()
+            metrics.DB_POOL_WAIT.observe(time.perf_counter() - start)
+        return await db.run_sync(fn, *args)
+    return await run_in_threadpool(_timed_call, db, fn, *args)
+
+# Cambios publicados en /events para el panel:
+#   {"type": "upsert", "license": {...}}  fila completa (nueva o modificada)
+#   {"type": "patch", "key": ..., "changes": {...}}  activación (solo hwid/activated_at)
+#   {"type": "delete", "id": ...}
+#   {"type": "resync"}  demasiados cambios: el panel pide el delta
+# En license_changes el evento lleva además "stats": ajustes para LicenseStats.apply
+def _notify(event):
+    event_bus.publish(event)
+
+def _activation_event(key, hwid, activated_at):
+    return {"type": "patch", "key": key, "changes": {"hwid": hwid, "activated_at": activated_at}}
+
+def _record_change(db, key, event, stats=None):
+    """Con CHANGE_LOG=1 guarda el evento en la transacción actual para los demás workers.
+
+    Se llama antes del commit; el evento devuelto se publica en local con _notify después.
+    stats: ajustes de contadores que los demás workers aplican tal cual; sin ellos
+    (importaciones) los demás recuentan.
+    """
+    if CHANGE_LOG:
+        change_feed.record(db, key, event if stats is None else dict(event, stats=stats))
+    return event
+
+def _bind_stats(bot_name, hwid, expires_at):
+    """Ajuste de una vinculación nueva: la licencia pasa de unbound a bound."""
+    return [(bot_name, True, None, expires_at, -1), (bot_name, True, hwid, expires_at, 1)]
+
+def _apply_remote_changes(changes):
+    """Aplica lo que confirmaron otros workers: caché, filtro de keys, stats y panel."""
+    resync = False
+    recount = False
+    for key, event in changes:
+        stats = event.pop("stats", None)
+        if stats is None:
+            recount = True
+        else:
+            license_stats.apply(stats)
+        if key:
+            license_cache.invalidate(key)
+        if event["type"] == "upsert":
+            key_filter.add(key)
+        elif event["type"] == "resync":
+            for new_key in event.get("keys", ()):
+                license_cache.invalidate(new_key)
+                key_filter.add(new_key)
+            resync = True
+            continue
+        _notify(event)
+    if resync:
+        _notify({"type": "resync"})
+    if recount:
+        license_stats.stale = True
+
+async def _change_loop():
+    while True:
+        try:
+            async with db_session() as db:
+                _apply_remote_changes(await run_db(db, change_feed.poll))
+        except Exception as e:
+            log.warning("No se pudo leer el registro de cambios: %s", e)
+        await asyncio.sleep(CHANGE_POLL_INTERVAL)
+
+# --- PETICIONES CONDICIONALES (ETag / 304) ---
+
+# Cambia en cada arranque: los ETag de un proceso anterior no deben coincidir
+BOOT_ID = uuid.uuid4().hex
+
+def _not_modified(request, etag):
+    """True si el If-None-Match del cliente coincide con el ETag (comparación débil)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+# --- MÉTRICAS ---
+
+def _instrument_engines():
+    metrics.instrument_engine(models.engine)
+    if models.async_engine is not None:
+        metrics.instrument_engine(models.async_engine.sync_engine)
+
+def _pool_checked_out():
+    engine = models.async_engine or models.engine
+    return engine.pool.checkedout() if engine is not None else 0
+
+metrics.registry.callback("authkey_db_pool_checked_out", "Conexiones del pool en uso", _pool_checked_out)
+metrics.registry.callback("authkey_license_cache_hits_total", "Aciertos de la caché de /validate",
+                          lambda: license_cache.hits, kind="counter")
+metrics.registry.callback("authkey_license_cache_misses_total", "Fallos de la caché de /validate",
+                          lambda: license_cache.misses, kind="counter")
+metrics.registry.callback("authkey_license_cache_entries", "Entradas en la caché de /validate", lambda: len(license_cache))
+metrics.registry.callback("authkey_key_filter_rejected_total", "Keys inexistentes rechazadas sin consultar la DB",
+                          lambda: key_filter.rejected, kind="counter")
+metrics.registry.callback("authkey_rate_limited_ip_total", "Peticiones rechazadas por el límite por IP",
+                          lambda: ip_limiter.limited, kind="counter")
+metrics.registry.callback("authkey_rate_limited_key_total", "Peticiones rechazadas por el límite por licencia",
+                          lambda: license_limiter.limited, kind="counter")
+metrics.registry.callback("authkey_sse_subscribers", "Paneles conectados a /events", lambda: len(event_bus))
+metrics.registry.callback("authkey_validation_events_dropped_total", "Eventos de validación descartados por buffer lleno",
+                          lambda: usage_tracker.dropped_events, kind="counter")
+
+async def _metrics_loop():
+    while True:
+        await asyncio.sleep(metrics.METRICS_FLUSH_INTERVAL)
+        try:
+            await run_in_threadpool(metrics.registry.dump)
+        except OSError as e:
+            log.warning("No se pudieron volcar las métricas: %s", e)
+
+@app.exception_handler(HTTPException)
+async def record_reason(request: Request, exc: HTTPException):
+    # Expone el motivo (invalid_key, expired, ...) a las métricas por petición
+    if isinstance(exc.detail, dict) and "reason" in exc.detail:
+        request.state.reason = exc.detail["reason"]
+    return await http_exception_handler(request, exc)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    body = await run_in_threadpool(metrics.registry.render)
+    return Response(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# --- PROTECCIÓN CONTRA ABUSO ---
+
+def _load_key_filter():
+    key_filter.begin_load()
+    with models.SessionLocal() as db:
+        expected = db.query(func.count(models.License.id)).scalar()
+        keys = (row.key for row in db.query(models.License.key).yield_per(10000))
+        key_filter.load(keys, expected)
+
+async def _key_filter_loop():
+    # La primera carga la hace _warm_up
+    while True:
+        await asyncio.sleep(KEY_FILTER_RELOAD)
+        try:
+            await run_in_threadpool(_load_key_filter)
+        except Exception as e:
+            log.warning("No se pudo cargar el filtro de keys: %s", e)
+
+async def _flush_tracking():
+    try:
+        async with db_session() as db:
+            await run_db(db, usage_tracker.flush)
+    except Exception as e:
+        log.warning("No se pudo guardar last_seen/validation_count: %s", e)
+
+async def _tracking_loop():
+    # Escritura diferida: /validate nunca espera por estas escrituras
+    while True:
+        await asyncio.sleep(TRACKING_FLUSH_INTERVAL)
+        await _flush_tracking()
+
+async def _reconcile_stats():
+    async with db_session() as db:
+        await run_db(db, license_stats.reconcile)
+
+async def _stats_loop():
+    while True:
+        try:
+            await _reconcile_stats()
+        except Exception as e:
+            log.warning("No se pudieron recontar las licencias: %s", e)
+        await asyncio.sleep(STATS_RECONCILE_INTERVAL)
+
+def _client_ip(request):
+    if TRUST_PROXY_HEADERS:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            # La última IP es la que añadió nuestro proxy; las anteriores las controla el cliente
+            return forwarded.split(",")[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+def _rate_limit(request, *keys, cost=1):
+    """429 si la IP (o alguna de las keys) superó su cuota.
+
+    cost: licencias que la petición lleva a la DB. Lo que se resuelve con la caché o el
+    filtro de keys no gasta cuota de IP (cost=0): cientos de bots tras una misma IP
+    pueden reiniciar a la vez.
+    """
+    wait = ip_limiter.allow(_client_ip(request), cost) if cost else 0
+    if not wait:
+        # Se cobra a cada key; la espera es la de la más limitada
+        wait = max([license_limiter.allow(key) for key in keys], default=0)
+    if wait:
+        raise HTTPException(
+            status_code=429,
+            detail={"reason": "rate_limited", "message": "Demasiadas peticiones, intenta más tarde"},
+            headers={"Retry-After": str(max(1, math.ceil(wait)))},
+        )
+
+# --- ARRANQUE Y DISPONIBILIDAD ---
+
+readiness = {"ready": False, "warmup_seconds": None, "cached_keys": 0}
+
+def _open_connections(engine, count):
+    """Abre `count` conexiones a la vez y las devuelve al pool, ya establecidas."""
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(engine.connect())
+    finally:
+        for conn in connections:
+            conn.close()
+
+async def _open_async_connections(engine, count):
+    async with AsyncExitStack() as stack:
+        for _ in range(count):
+            await stack.enter_async_context(engine.connect())
+
+def _preload_hot_keys(db):
+    """Carga en la caché las licencias vinculadas que se validaron más recientemente."""
+    License = models.License
+    generation = license_cache.generation()
+    rows = (
+        db.query(License.key, License.is_active, License.hwid, License.expires_at)
+        .filter(License.hwid.isnot(None), License.last_seen_at.isnot(None))
+        .order_by(License.last_seen_at.desc())
+        .limit(WARMUP_KEYS)
+        .all()
+    )
+    # La más reciente se inserta al final: es la última que sacaría el LRU
+    for row in reversed(rows):
+        license_cache.set(row.key, LicenseState(row.is_active, row.hwid, row.expires_at), generation)
+    return len(rows)
+
+async def _warm_up():
+    start = time.perf_counter()
+    try:
+        await run_in_threadpool(_open_connections, models.engine, WARMUP_CONNECTIONS)
+        if models.async_engine is not None:
+            await _open_async_connections(models.async_engine, WARMUP_CONNECTIONS)
+        async with db_session() as db:
+            readiness["cached_keys"] = await run_db(db, _preload_hot_keys)
+        await run_in_threadpool(_load_key_filter)
+    except Exception as e:
+        # Se atiende igualmente: sin caché ni filtro cada petición va a la DB, como antes
+        log.warning("Calentamiento incompleto: %s", e)
+    readiness["warmup_seconds"] = round(time.perf_counter() - start, 3)
+    readiness["ready"] = True
+    log.info("Servidor listo en %.2fs (%d licencias en caché)", readiness["warmup_seconds"], readiness["cached_keys"])
+
+@app.get("/health")
+async def health():
+    """Liveness: el proceso responde (no consulta la DB)."""
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 503 hasta que termina el calentamiento. Úsalo como health check del balanceador."""
+    if not readiness["ready"]:
+        raise HTTPException(status_code=503, detail={"reason": "warming_up", "message": "Servidor arrancando"})
+    return {"status": "ready", **readiness}
 
 # --- API ENDPOINTS ---
 
+def _insert_license(db, license_entry):
+    db.add(license_entry)
+    db.flush()
+    data = _license_to_dict(license_entry)
+    stats = [(data["bot_name"], data["is_active"], None, data["expires_at"], 1)]
+    event = _record_change(db, data["key"], {"type": "upsert", "license": data}, stats)
+    db.commit()
+    key_filter.add(license_entry.key)
+    license_stats.apply(stats)
+    _notify(event)
+
 @app.post("/generate")
-def generate_key(note: str = None, bot_name: str = "Generic Bot", duration_days: int = 0, db: Session = Depends(get_db)):
+async def generate_key(note: str = None, bot_name: str = "Generic Bot", duration_days: int = 0, db=Depends(get_db)):
     """
     duration_days: 0 = Indefinida, 30 = 1 Mes, etc.
     """
@@ -39,92 +402,622 @@ def generate_key(note: str = None, bot_name: str = "Generic Bot", duration_days:
         expires_at = datetime.datetime.utcnow() + datetime.timedelta(days=duration_days)
 
     license_entry = models.License(key=new_key, note=note, bot_name=bot_name, expires_at=expires_at)
-    db.add(license_entry)
-    db.commit()
-    db.refresh(license_entry)
+    await run_db(db, _insert_license, license_entry)
     return {"status": "success", "key": new_key}
 
-@app.post("/activate")
-def activate_license(key: str, hwid: str, db: Session = Depends(get_db)):
-    print(f"[DEBUG] Intento de activar Key: {key} para HWID: {hwid}")
-    license_entry = db.query(models.License).filter(models.License.key == key).first()
+def _insert_bulk(db, rows):
+    db.execute(insert(models.License), rows)
+    counts = collections.Counter((row["bot_name"], row["expires_at"]) for row in rows)
+    stats = [(bot_name, True, None, expires_at, n) for (bot_name, expires_at), n in counts.items()]
+    # Los demás workers añaden estas keys a su filtro y avisan a su panel
+    _record_change(db, None, {"type": "resync", "keys": [row["key"] for row in rows]}, stats)
+    db.commit()
+    for row in rows:
+        key_filter.add(row["key"])
+    license_stats.apply(stats)
+
+@app.post("/generate/bulk")
+async def generate_bulk(count: int, bot_name: str = "Generic Bot", duration_days: int = 0, note_prefix: str = None, format: str = "csv"):
+    """Genera muchas keys de una vez (alta de revendedores) y las devuelve en streaming.
+
+    Se insertan en transacciones de BULK_CHUNK_SIZE filas; cada bloque se envía al
+    cliente en cuanto se confirma. format: csv | jsonl.
+    """
+    if not 0 < count <= BULK_GENERATE_MAX:
+        raise HTTPException(status_code=400, detail=f"count debe estar entre 1 y {BULK_GENERATE_MAX}")
+    if format not in ("csv", "jsonl"):
+        raise HTTPException(status_code=400, detail="format debe ser csv o jsonl")
+
+    now = datetime.datetime.utcnow()
+    expires_at = now + datetime.timedelta(days=duration_days) if duration_days > 0 else None
+
+    def make_row(n):
+        note = f"{note_prefix} #{n}" if note_prefix else None
+        return {
+            "key": str(uuid.uuid4()).upper(), "note": note, "bot_name": bot_name, "is_active": True,
+            "expires_at": expires_at, "created_at": now, "updated_at": now,
+        }
+
+    def serialize(rows):
+        if format == "jsonl":
+            return "".join(json.dumps(jsonable_encoder({k: row[k] for k in ("key", "note", "bot_name", "expires_at")})) + "\n" for row in rows)
+        out = io.StringIO()
+        writer = csv.writer(out)
+        for row in rows:
+            writer.writerow([row["key"], row["note"] or "", row["bot_name"], row["expires_at"].isoformat() if row["expires_at"] else ""])
+        return out.getvalue()
+
+    async def stream():
+        if format == "csv":
+            yield "key,note,bot_name,expires_at\n"
+        try:
+            async with db_session() as db:
+                for start in range(0, count, BULK_CHUNK_SIZE):
+                    rows = [make_row(n + 1) for n in range(start, min(start + BULK_CHUNK_SIZE, count))]
+                    await run_db(db, _insert_bulk, rows)
+                    yield serialize(rows)
+        finally:
+            # Un solo aviso al panel en lugar de miles de eventos
+            _notify({"type": "resync"})
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"licenses_{now:%Y%m%d_%H%M%S}.{format}"
+    return StreamingResponse(stream(), media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+INVALID_KEY = ("invalid_key", "Clave inexistente")
+
+def _state_error(state, hwid):
+    """Devuelve (reason, message) si el estado de la licencia no permite el acceso, o None."""
+    if not state.is_active:
+        return ("key_disabled", "Clave bloqueada comercialmente")
+
+    # Check Expiration
+    if state.expires_at and state.expires_at < datetime.datetime.utcnow():
+        return ("expired", "Tu licencia ha expirado. Renueva tu suscripción.")
+
+    if _is_bound(state.hwid) and state.hwid != hwid:
+        return ("hwid_mismatch", "Esta clave pertenece a otro equipo")
+    return None
+
+def _is_bound(hwid):
+    return hwid is not None and hwid != models.LEGACY_HWID
+
+def _deny(error):
+    reason, message = error
+    raise HTTPException(status_code=403, detail={"reason": reason, "message": message})
+
+def _load_state(db, key):
+    """Lee el estado de la key y lo guarda en la caché. None si no existe."""
+    generation = license_cache.generation()
+    row = db.query(models.License.is_active, models.License.hwid, models.License.expires_at).filter(models.License.key == key).first()
+    if row is None:
+        return None
+    state = LicenseState(row.is_active, row.hwid, row.expires_at)
+    license_cache.set(key, state, generation)
+    return state
+
+def _bind_hwid(db, key, hwid, now, allow_same_hwid=False):
+    """Vincula la key al HWID con un único UPDATE condicional (sin SELECT previo).
+
+    Solo afecta a la fila si la key existe, está activa, no ha expirado y no tiene
+    HWID (o ya tiene este mismo, si allow_same_hwid). Así dos equipos activando la
+    misma key a la vez no pueden ganar ambos. Devuelve (LicenseState, ajustes de stats)
+    si la fila quedó vinculada, o (None, None); el llamador debe hacer commit y, después,
+    guardar el estado en la caché con la generación leída antes del UPDATE.
+
+    Una key vinculada a LEGACY_HWID (clientes antiguos en Linux/macOS) se revincula
+    una sola vez al primer HWID real que la use.
+    """
+    License = models.License
+    unbound = License.hwid.is_(None)
+    if hwid != models.LEGACY_HWID:
+        unbound = or_(unbound, License.hwid == models.LEGACY_HWID)
+    row = _bind_update(db, key, hwid, now, unbound)
+    if row is not None:
+        stats = _bind_stats(row.bot_name, hwid, row.expires_at)
+    elif allow_same_hwid:
+        # Ya vinculada a este mismo equipo: solo se renueva activated_at
+        row = _bind_update(db, key, hwid, now, License.hwid == hwid)
+        stats = []
+    if row is None:
+        return None, None
+    return LicenseState(True, hwid, row.expires_at), stats
+
+def _bind_update(db, key, hwid, now, hwid_condition):
+    """UPDATE condicional de _bind_hwid. Devuelve la fila (expires_at, bot_name) o None."""
+    License = models.License
+    stmt = (
+        update(License)
+        .where(
+            License.key == key,
+            hwid_condition,
+            License.is_active == True,  # noqa: E712
+            or_(License.expires_at.is_(None), License.expires_at > now),
+        )
+        .values(hwid=hwid, activated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if db.get_bind().dialect.update_returning:
+        return db.execute(stmt.returning(License.expires_at, License.bot_name)).first()
+    if db.execute(stmt).rowcount != 1:
+        return None
+    # Sin RETURNING (SQLite < 3.35) hay que releer la fila
+    return db.query(License.expires_at, License.bot_name).filter(License.key == key).first()
+
+def _granted(message, key, hwid, expires_at):
+    """Respuesta de acceso concedido, con lease firmado si el servidor tiene clave de firma."""
+    response = {"valid": True, "message": message}
+    lease = issue_lease(key, hwid, expires_at)
+    if lease:
+        response["lease"] = lease
+    return response
+
+def _activate(db, key, hwid):
+    log.debug("Intento de activar Key: %s para HWID: %s", key, hwid)
+    now = datetime.datetime.utcnow()
+    generation = license_cache.generation()
+    state, stats = _bind_hwid(db, key, hwid, now, allow_same_hwid=True)
+    if state:
+        event = _record_change(db, key, _activation_event(key, hwid, now), stats)
+        db.commit()
+        license_cache.set(key, state, generation)
+        license_stats.apply(stats)
+        _notify(event)
+        log.info("Key %s vinculada exitosamente a %s", key, hwid)
+        response = {"status": "success", "message": "Clave activada"}
+        lease = issue_lease(key, hwid, state.expires_at)
+        if lease:
+            response["lease"] = lease
+        return response
+
+    # El UPDATE no afectó ninguna fila: averiguar por qué
+    state = _load_state(db, key)
     
-    if not license_entry:
+    if state is None:
         raise HTTPException(status_code=404, detail="Key no encontrada")
     
-    if license_entry.is_active is False:
+    if state.is_active is False:
         raise HTTPException(status_code=403, detail="Key desactivada")
         
-    if license_entry.hwid and license_entry.hwid != hwid:
+    if state.hwid and state.hwid != hwid:
          raise HTTPException(status_code=403, detail="Key ya usada en otra maquina")
 
-    # Verificar expiración
-    if license_entry.expires_at and license_entry.expires_at < datetime.datetime.utcnow():
-        raise HTTPException(status_code=403, detail="Key expirada")
+    raise HTTPException(status_code=403, detail="Key expirada")
 
-    license_entry.hwid = hwid
-    license_entry.activated_at = datetime.datetime.utcnow()
-    db.commit()
-    
-    print(f"[DEBUG] Key {key} vinculada exitosamente a {hwid}")
-    return {"status": "success", "message": "Clave activada"}
+@app.post("/activate")
+async def activate_license(request: Request, key: str, hwid: str, db=Depends(get_db)):
+    _rate_limit(request, key)
+    if not key_filter.might_exist(key):
+        raise HTTPException(status_code=404, detail="Key no encontrada")
+    return await run_db(db, _activate, key, hwid)
 
 @app.get("/validate")
-def validate_license(key: str, hwid: str, db: Session = Depends(get_db)):
+async def validate_license(request: Request, key: str, hwid: str, db=Depends(get_db)):
     """Verifica la clave y la vincula de forma automática si es nueva (Auto-Activation)."""
-    # print(f"[DEBUG] Validando Key: {key} ...") # Reduce spam log
-    license_entry = db.query(models.License).filter(models.License.key == key).first()
-    
-    if not license_entry:
-        raise HTTPException(status_code=403, detail={"reason": "invalid_key", "message": "Clave inexistente"})
-    
-    if not license_entry.is_active:
-        raise HTTPException(status_code=403, detail={"reason": "key_disabled", "message": "Clave bloqueada comercialmente"})
+    _rate_limit(request, key, cost=0)
+    ip = _client_ip(request) if usage_tracker.record_events else None
+    try:
+        response = await _check_validate(request, key, hwid, db)
+    except HTTPException as exc:
+        usage_tracker.record(key, hwid, ip, exc.detail["reason"])
+        raise
+    usage_tracker.record(key, hwid, ip, "ok")
+    return response
 
-    # Check Expiration
-    if license_entry.expires_at and license_entry.expires_at < datetime.datetime.utcnow():
-        raise HTTPException(status_code=403, detail={"reason": "expired", "message": "Tu licencia ha expirado. Renueva tu suscripción."})
-
-    # AUTO-ACTIVACIÓN
-    if license_entry.hwid is None:
-        print(f"[DEBUG] Activando Key {key} por primera vez para HWID: {hwid}")
-        license_entry.hwid = hwid
-        license_entry.activated_at = datetime.datetime.utcnow()
+async def _check_validate(request, key, hwid, db):
+    # Camino rápido: licencia ya vinculada y en caché, sin tocar la DB
+    state = license_cache.get(key)
+    if state is not None and _is_bound(state.hwid):
+        error = _state_error(state, hwid)
+        if error:
+            _deny(error)
+        return _granted("Acceso concedido", key, hwid, state.expires_at)
+
+    # Keys inventadas o de fuerza bruta: rechazo sin consultar la DB
+    if not key_filter.might_exist(key):
+        _deny(INVALID_KEY)
+
+    _rate_limit(request)
+    return await run_db(db, _validate, key, hwid)
+
+def _validate(db, key, hwid):
+    # Lo habitual es una key ya vinculada fuera de caché: basta un SELECT
+    state = _load_state(db, key)
+    if state is None:
+        _deny(INVALID_KEY)
+    error = _state_error(state, hwid)
+    if error:
+        _deny(error)
+    if _is_bound(state.hwid) or state.hwid == hwid:
+        return _granted("Acceso concedido", key, hwid, state.expires_at)
+
+    # AUTO-ACTIVACIÓN: el UPDATE condicional decide quién gana si dos equipos llegan a la vez
+    now = datetime.datetime.utcnow()
+    generation = license_cache.generation()
+    state, stats = _bind_hwid(db, key, hwid, now)
+    if state:
+        event = _record_change(db, key, _activation_event(key, hwid, now), stats)
         db.commit()
-        return {"valid": True, "message": "Clave activada y vinculada exitosamente"}
+        license_cache.set(key, state, generation)
+        license_stats.apply(stats)
+        _notify(event)
+        log.info("Key %s activada por primera vez para HWID: %s", key, hwid)
+        return _granted("Clave activada y vinculada exitosamente", key, hwid, state.expires_at)
 
-    if license_entry.hwid != hwid:
-        raise HTTPException(status_code=403, detail={"reason": "hwid_mismatch", "message": "Esta clave pertenece a otro equipo"})
+    # Otra petición la vinculó (o la bloqueó) entre la lectura y el UPDATE
+    state = _load_state(db, key)
+    if state is None:
+        _deny(INVALID_KEY)
+    error = _state_error(state, hwid)
+    if error:
+        _deny(error)
+    return _granted("Acceso concedido", key, hwid, state.expires_at)
 
-    return {"valid": True, "message": "Acceso concedido"}
+def _validate_pending(db, items, pending, results):
+    """Resuelve en results[i] los items del lote que no estaban en caché."""
+    License = models.License
+    keys = {items[i].key for i in pending}
+    generation = license_cache.generation()
+    rows = db.query(License.key, License.is_active, License.hwid, License.expires_at).filter(License.key.in_(keys))
+    states = {row.key: LicenseState(row.is_active, row.hwid, row.expires_at) for row in rows}
+
+    activated = []
+    now = datetime.datetime.utcnow()
+    for i in pending:
+        item = items[i]
+        state = states.get(item.key)
+        if state is None:
+            results[i] = INVALID_KEY
+            continue
+        error = _state_error(state, item.hwid)
+        if error is None and not _is_bound(state.hwid):
+            bound, stats = _bind_hwid(db, item.key, item.hwid, now)
+            if bound:
+                # Una misma key repetida en el lote queda vinculada al primer HWID
+                states[item.key] = bound
+                activated.append((item, stats))
+                results[i] = "activated"
+                continue
+            # Otra petición la vinculó entre la lectura y el UPDATE
+            states[item.key] = _load_state(db, item.key)
+            error = _state_error(states[item.key], item.hwid) if states[item.key] else INVALID_KEY
+        results[i] = error
+
+    events = []
+    if activated:
+        events = [_record_change(db, item.key, _activation_event(item.key, item.hwid, now), stats)
+                  for item, stats in activated]
+        db.commit()
+    # Solo tras el commit: un toggle concurrente invalida la generación y descarta estos estados
+    for key, state in states.items():
+        if state is not None:
+            license_cache.set(key, state, generation)
+    for _, stats in activated:
+        license_stats.apply(stats)
+    for event in events:
+        _notify(event)
+
+class ValidateItem(BaseModel):
+    key: str
+    hwid: str
+
+@app.post("/validate/batch")
+async def validate_batch(request: Request, items: List[ValidateItem], db=Depends(get_db)):
+    """Valida muchas licencias en una sola petición (flotas de bots en un mismo host).
+
+    Las claves que no están en caché se resuelven con una única consulta IN (...) y
+    todas las auto-activaciones se guardan en una sola transacción.
+    """
+    if len(items) > VALIDATE_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Máximo {VALIDATE_BATCH_MAX} licencias por petición")
+    _rate_limit(request, *{item.key for item in items}, cost=0)
+
+    results = [None] * len(items)
+    pending = []
+    for i, item in enumerate(items):
+        state = license_cache.get(item.key)
+        if state is not None and _is_bound(state.hwid):
+            results[i] = _state_error(state, item.hwid)
+        elif not key_filter.might_exist(item.key):
+            results[i] = INVALID_KEY
+        else:
+            pending.append(i)
+
+    if pending:
+        # Cuota de IP: una por licencia que va a la DB, como validarlas una a una
+        _rate_limit(request, cost=len(pending))
+        await run_db(db, _validate_pending, items, pending, results)
+
+    ip = _client_ip(request) if usage_tracker.record_events else None
+    response = []
+    for item, result in zip(items, results):
+        if result is None:
+            response.append({"key": item.key, "valid": True, "message": "Acceso concedido"})
+        elif result == "activated":
+            response.append({"key": item.key, "valid": True, "message": "Clave activada y vinculada exitosamente"})
+        else:
+            reason, message = result
+            response.append({"key": item.key, "valid": False, "reason": reason, "message": message})
+        usage_tracker.record(item.key, item.hwid, ip, response[-1].get("reason", "ok"))
+    return {"results": response}
+
+def _license_to_dict(lic):
+    return {
+        "id": lic.id,
+        "key": lic.key,
+        "hwid": lic.hwid,
+        "is_active": lic.is_active,
+        "created_at": lic.created_at,
+        "activated_at": lic.activated_at,
+        "expires_at": lic.expires_at,
+        "note": lic.note,
+        "bot_name": lic.bot_name,
+        "updated_at": lic.updated_at,
+        "last_seen_at": lic.last_seen_at,
+        "validation_count": lic.validation_count or 0,
+    }
+
+LIST_DEFAULT_LIMIT = 100
+LIST_MAX_LIMIT = 1000
+# Margen que se resta a server_time para no perder filas confirmadas durante la consulta
+DELTA_OVERLAP = datetime.timedelta(seconds=2)
+DELETED_RETENTION = datetime.timedelta(days=7)
+
+def _encode_cursor(lic):
+    raw = f"{lic.created_at.isoformat()}|{lic.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor):
+    try:
+        created_at, license_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(created_at), int(license_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def _list_filters(now, bot_name, status, hwid, q):
+    License = models.License
+    not_expired = or_(License.expires_at.is_(None), License.expires_at > now)
+    filters = []
+    if bot_name:
+        filters.append(License.bot_name == bot_name)
+    if status == "active":
+        filters += [License.is_active == True, not_expired]  # noqa: E712
+    elif status == "blocked":
+        filters += [License.is_active == False, not_expired]  # noqa: E712
+    elif status == "expired":
+        filters.append(License.expires_at <= now)
+    if hwid == "bound":
+        filters += [License.hwid.isnot(None), License.hwid != models.LEGACY_HWID]
+    elif hwid == "unbound":
+        filters.append(or_(License.hwid.is_(None), License.hwid == models.LEGACY_HWID))
+    if q:
+        pattern = f"%{q}%"
+        filters.append(or_(License.note.ilike(pattern), License.key.ilike(pattern)))
+    return filters
+
+def _list(db, limit, after, updated_since, filters):
+    License = models.License
+    now = datetime.datetime.utcnow()
+    query = db.query(License).filter(*filters)
+
+    if updated_since is not None:
+        # Modo delta: solo lo que cambió desde el último sondeo del panel
+        rows = query.filter(License.updated_at > updated_since).order_by(License.updated_at).limit(limit + 1).all()
+        deleted = db.query(models.DeletedLicense.license_id).filter(models.DeletedLicense.deleted_at > updated_since)
+        return {
+            "items": [_license_to_dict(lic) for lic in rows[:limit]],
+            "deleted": [row.license_id for row in deleted],
+            # El panel debe recargar todo si el delta no cabe o es más viejo que el registro de borrados
+            "truncated": len(rows) > limit or updated_since < now - DELETED_RETENTION,
+            "server_time": now - DELTA_OVERLAP,
+        }
+
+    if after:
+        created_at, license_id = _decode_cursor(after)
+        query = query.filter(or_(
+            License.created_at < created_at,
+            and_(License.created_at == created_at, License.id < license_id),
+        ))
+    rows = query.order_by(License.created_at.desc(), License.id.desc()).limit(limit + 1).all()
+    return {
+        "items": [_license_to_dict(lic) for lic in rows[:limit]],
+        "next_cursor": _encode_cursor(rows[limit - 1]) if len(rows) > limit else None,
+        "server_time": now - DELTA_OVERLAP,
+    }
+
+def _list_etag(request, status):
+    # Versión de la tabla (cambios publicados + volcados de last_seen_at) y la consulta exacta
+    parts = [BOOT_ID, event_bus.version, usage_tracker.flushes, request.url.query]
+    if status:
+        # active/blocked/expired dependen de la hora aunque nadie modifique la tabla
+        parts.append(int(time.time() // 60))
+    return 'W/"' + hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest() + '"'
 
 @app.get("/licenses/list")
-def list_licenses(db: Session = Depends(get_db)):
-    return db.query(models.License).order_by(models.License.created_at.desc()).all()
+async def list_licenses(
+    request: Request,
+    response: Response,
+    limit: int = LIST_DEFAULT_LIMIT,
+    after: str = None,
+    updated_since: datetime.datetime = None,
+    bot_name: str = None,
+    status: str = None,
+    hwid: str = None,
+    q: str = None,
+    db=Depends(get_db),
+):
+    """Lista paginada por cursor (created_at, id), más reciente primero.
 
-@app.post("/licenses/toggle/{license_id}")
-def toggle_license(license_id: int, db: Session = Depends(get_db)):
+    status: active | blocked | expired. hwid: bound | unbound. q: busca en nota y key.
+    Con updated_since devuelve solo las filas modificadas y los ids borrados desde esa fecha;
+    el panel reenvía el server_time de la respuesta anterior.
+
+    Lleva ETag: si nada cambió desde la respuesta anterior devuelve 304 sin cuerpo.
+    """
+    # El ETag se calcula antes de consultar: un cambio durante la consulta lo invalida
+    etag = _list_etag(request, status)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    limit = max(1, min(limit, LIST_MAX_LIMIT))
+    if updated_since is not None and updated_since.tzinfo is not None:
+        # La DB guarda UTC sin zona: "...Z" o "+02:00" se pasan a ese formato
+        updated_since = updated_since.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    filters = _list_filters(datetime.datetime.utcnow(), bot_name, status, hwid, q)
+    return await run_db(db, _list, limit, after, updated_since, filters)
+
+@app.get("/licenses/stats")
+async def license_stats_summary(bot_name: str = None, db=Depends(get_db)):
+    """Conteos por bot_name: total, active, blocked, expired, bound y unbound.
+
+    Sale de contadores en memoria (sin recorrer la tabla); reconciled_at indica el último
+    recuento completo. Las licencias que expiran solas se reflejan en el siguiente recuento.
+    """
+    if not license_stats.ready or license_stats.stale:
+        await run_db(db, license_stats.reconcile)
+    return license_stats.snapshot(bot_name)
+
+def _toggle(db, license_id):
     lic = db.query(models.License).filter(models.License.id == license_id).first()
     if lic:
-        lic.is_active = not lic.is_active
+        lic.is_active = new_state = not lic.is_active
+        key = lic.key
+        db.flush()
+        data = _license_to_dict(lic)
+        stats = [
+            (data["bot_name"], not new_state, data["hwid"], data["expires_at"], -1),
+            (data["bot_name"], new_state, data["hwid"], data["expires_at"], 1),
+        ]
+        event = _record_change(db, key, {"type": "upsert", "license": data}, stats)
         db.commit()
-        return {"status": "success", "new_state": lic.is_active}
+        # Se invalida en vez de guardar: dos toggles a la vez podrían dejar el estado viejo
+        license_cache.invalidate(key)
+        license_stats.apply(stats)
+        _notify(event)
+        return {"status": "success", "new_state": new_state}
     return {"status": "error"}
 
-@app.post("/licenses/delete/{license_id}")
-def delete_license(license_id: int, db: Session = Depends(get_db)):
+@app.post("/licenses/toggle/{license_id}")
+async def toggle_license(license_id: int, db=Depends(get_db)):
+    return await run_db(db, _toggle, license_id)
+
+def _delete(db, license_id):
     lic = db.query(models.License).filter(models.License.id == license_id).first()
     if lic:
+        key = lic.key
+        stats = [(lic.bot_name, lic.is_active, lic.hwid, lic.expires_at, -1)]
         db.delete(lic)
+        db.add(models.DeletedLicense(license_id=lic.id, key=key))
+        # Los registros de borrado solo hacen falta mientras un panel pueda pedir ese delta
+        db.query(models.DeletedLicense).filter(
+            models.DeletedLicense.deleted_at < datetime.datetime.utcnow() - DELETED_RETENTION
+        ).delete(synchronize_session=False)
+        event = _record_change(db, key, {"type": "delete", "id": license_id}, stats)
         db.commit()
+        license_cache.invalidate(key)
+        license_stats.apply(stats)
+        _notify(event)
         return {"status": "success"}
     return {"status": "error"}
 
+@app.post("/licenses/delete/{license_id}")
+async def delete_license(license_id: int, db=Depends(get_db)):
+    return await run_db(db, _delete, license_id)
+
+# --- EXPORTACIÓN / IMPORTACIÓN ---
+
+@app.get("/licenses/export")
+async def export_licenses(format: str = "csv", bot_name: str = None):
+    """Descarga la tabla completa (o la de un bot) en CSV o JSONL, en streaming.
+
+    Las filas se leen con un cursor del lado del servidor: la memoria no depende del tamaño.
+    """
+    if format not in transfer.FORMATS:
+        raise HTTPException(status_code=400, detail="format debe ser csv o jsonl")
+
+    def stream():
+        # Generador síncrono: Starlette lo recorre en el threadpool con su propia conexión
+        if format == "csv":
+            yield transfer.serialize([], format, header=True)
+        with models.engine.connect() as conn:
+            for rows in transfer.iter_chunks(conn, bot_name=bot_name):
+                yield transfer.serialize(rows, format)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"licenses_export_{datetime.datetime.utcnow():%Y%m%d_%H%M%S}.{format}"
+    return StreamingResponse(stream(), media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+def _import_chunk(db, rows):
+    now = datetime.datetime.utcnow()
+    for row in rows:
+        # Las filas importadas son un cambio para el modo delta del panel
+        row["updated_at"] = now
+    transfer.upsert(db, rows)
+    _record_change(db, None, {"type": "resync", "keys": [row["key"] for row in rows]})
+    db.commit()
+    for row in rows:
+        license_cache.invalidate(row["key"])
+        key_filter.add(row["key"])
+
+def _import_file(spool, format):
+    imported = 0
+    text_file = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+    with models.SessionLocal() as db:
+        try:
+            for rows in transfer.read_chunks(transfer.parse(text_file, format), BULK_CHUNK_SIZE):
+                _import_chunk(db, rows)
+                imported += len(rows)
+        except ValueError as e:
+            raise ValueError(f"{e} ({imported} filas ya importadas)")
+    return imported
+
+@app.post("/licenses/import")
+async def import_licenses(request: Request, format: str = "csv"):
+    """Importa un CSV/JSONL como el de /licenses/export (cuerpo de la petición), con upsert por key.
+
+    El cuerpo se vuelca a un archivo temporal y se guarda en transacciones de
+    BULK_CHUNK_SIZE filas; si una fila es inválida, los bloques anteriores quedan guardados.
+    """
+    if format not in transfer.FORMATS:
+        raise HTTPException(status_code=400, detail="format debe ser csv o jsonl")
+    with tempfile.TemporaryFile() as spool:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        try:
+            imported = await run_in_threadpool(_import_file, spool, format)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        finally:
+            license_stats.stale = True
+            _notify({"type": "resync"})
+    return {"status": "success", "imported": imported}
+
+@app.get("/events")
+async def license_events(request: Request):
+    """Server-Sent Events con los cambios de licencias; el panel parchea filas sin sondear."""
+    queue = event_bus.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Mantiene viva la conexión a través de proxies
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(jsonable_encoder(event))}\n\n"
+        finally:
+            event_bus.unsubscribe(queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # --- DASHBOARD UI ---
 
-@app.get("/", response_class=HTMLResponse)
-async def dashboard(request: Request):
-    html_content = """
+DASHBOARD_HTML = """
     <!DOCTYPE html>
     <html lang="es">
     <head>
@@ -179,6 +1072,9 @@ async def dashboard(request: Request):
             .form-actions { display: flex; justify-content: flex-end; gap: 10px; margin-top: 20px; }
             .btn-cancel { background: transparent; border: 1px solid var(--text-muted); }
             .expired-tag { font-size: 0.75rem; background: rgba(245, 158, 11, 0.2); color: var(--warning); padding: 2px 6px; border-radius: 4px; border: 1px solid rgba(245, 158, 11, 0.5); }
+            .filters { display: flex; gap: 10px; }
+            .filters input, .filters select { width: auto; flex: 1; }
+            .load-more { display: none; margin: 20px auto 0; }
         </style>
     </head>
     <body>
@@ -192,6 +1088,21 @@ async def dashboard(request: Request):
             </header>
             
             <div class="card">
+                <div class="filters">
+                    <input type="text" id="filterQuery" placeholder="Buscar cliente o key..." oninput="onFiltersChanged()">
+                    <input type="text" id="filterBot" placeholder="Bot" oninput="onFiltersChanged()">
+                    <select id="filterStatus" onchange="onFiltersChanged()">
+                        <option value="">Todos los estados</option>
+                        <option value="active">Activas</option>
+                        <option value="blocked">Bloqueadas</option>
+                        <option value="expired">Expiradas</option>
+                    </select>
+                    <select id="filterHwid" onchange="onFiltersChanged()">
+                        <option value="">Con y sin HWID</option>
+                        <option value="bound">Vinculadas</option>
+                        <option value="unbound">Sin vincular</option>
+                    </select>
+                </div>
                 <table>
                     <thead>
                         <tr>
@@ -201,12 +1112,14 @@ async def dashboard(request: Request):
                             <th>Cliente</th>
                             <th>HWID</th>
                             <th>Expiración</th>
+                            <th>Último uso</th>
                             <th>Estado</th>
                             <th>Acciones</th>
                         </tr>
                     </thead>
                     <tbody id="licenseTable"></tbody>
                 </table>
+                <button id="loadMore" class="load-more" onclick="loadLicenses(false)">Cargar más</button>
             </div>
         </div>
 
@@ -257,59 +1170,200 @@ async def dashboard(request: Request):
             function openModal() { document.getElementById('newKeyModal').style.display = 'flex'; }
             function closeModal() { document.getElementById('newKeyModal').style.display = 'none'; }
 
-            async function loadLicenses() {
+            const PAGE_SIZE = 200;
+            const shown = new Map();   // id -> licencia mostrada en la tabla
+            const idsByKey = new Map(); // key -> id, para los eventos de activación
+            let nextCursor = null;
+            let lastSync = null;       // server_time de la última respuesta
+            let filterTimer = null;
+
+            function getFilters() {
+                return {
+                    q: document.getElementById('filterQuery').value.trim(),
+                    bot_name: document.getElementById('filterBot').value.trim(),
+                    status: document.getElementById('filterStatus').value,
+                    hwid: document.getElementById('filterHwid').value,
+                };
+            }
+
+            function isExpired(lic) {
+                return lic.expires_at && new Date() > new Date(lic.expires_at);
+            }
+
+            // UNKNOWN_HWID (clientes antiguos) cuenta como libre, igual que en el servidor
+            function isBound(lic) {
+                return !!lic.hwid && lic.hwid !== 'UNKNOWN_HWID';
+            }
+
+            // Misma lógica que los filtros del servidor, para decidir qué hacer con las filas del delta
+            function matchesFilters(lic) {
+                const f = getFilters();
+                if (f.bot_name && lic.bot_name !== f.bot_name) return false;
+                if (f.status === 'active' && (!lic.is_active || isExpired(lic))) return false;
+                if (f.status === 'blocked' && (lic.is_active || isExpired(lic))) return false;
+                if (f.status === 'expired' && !isExpired(lic)) return false;
+                if (f.hwid === 'bound' && !isBound(lic)) return false;
+                if (f.hwid === 'unbound' && isBound(lic)) return false;
+                if (f.q) {
+                    const q = f.q.toLowerCase();
+                    if (!(lic.note || '').toLowerCase().includes(q) && !lic.key.toLowerCase().includes(q)) return false;
+                }
+                return true;
+            }
+
+            function renderRow(lic) {
+                let expirationText = "Indefinido";
+                
+                if (lic.expires_at) {
+                    expirationText = new Date(lic.expires_at).toLocaleDateString();
+                    if (isExpired(lic)) {
+                        expirationText += " <br><span class='expired-tag'>VENCIDA</span>";
+                    }
+                }
+
+                let statusHtml = "";
+                if (isExpired(lic)) {
+                    statusHtml = "<span class='status-expired'>EXPIRADA</span>";
+                } else {
+                    statusHtml = lic.is_active ? "<span class='status-active'>ACTIVA</span>" : "<span class='status-inactive'>BLOQUEADA</span>";
+                }
+
+                const tr = document.createElement('tr');
+                tr.id = 'lic-' + lic.id;
+                tr.innerHTML = `
+                    <td>${lic.id}</td>
+                    <td><strong>${lic.bot_name || 'Generic'}</strong></td>
+                    <td class="key-cell" onclick="copyKey(this, '${lic.key}')" title="Clic para copiar">${lic.key}</td>
+                    <td>${lic.note || '-'}</td>
+                    <td>${lic.hwid ? '<span style="font-family:monospace; font-size:0.8rem">'+lic.hwid+'</span>' : '<em style="color:#64748b;">Esperando...</em>'}</td>
+                    <td style="font-size:0.9rem">${expirationText}</td>
+                    <td style="font-size:0.9rem">${lic.last_seen_at ? new Date(lic.last_seen_at + 'Z').toLocaleString() + '<br><span style="color:var(--text-muted)">' + lic.validation_count + ' validaciones</span>' : '<em style="color:#64748b;">Nunca</em>'}</td>
+                    <td>${statusHtml}</td>
+                    <td>
+                        <button class="action-btn" onclick="toggleStatus(${lic.id})">
+                            ${lic.is_active ? 'Bloquear' : 'Activar'}
+                        </button>
+                        <button class="action-btn btn-delete" onclick="deleteLicense(${lic.id})">X</button>
+                    </td>
+                `;
+                return tr;
+            }
+
+            function removeRow(id) {
+                const tr = document.getElementById('lic-' + id);
+                if (tr) tr.remove();
+                const lic = shown.get(id);
+                if (lic) idsByKey.delete(lic.key);
+                shown.delete(id);
+            }
+
+            function upsertRow(lic) {
+                const existing = document.getElementById('lic-' + lic.id);
+                if (!matchesFilters(lic)) {
+                    if (existing) removeRow(lic.id);
+                    return;
+                }
+                const tr = renderRow(lic);
+                if (existing) {
+                    existing.replaceWith(tr);
+                } else {
+                    // Filas nuevas arriba; las antiguas llegarán al paginar
+                    const tbody = document.getElementById('licenseTable');
+                    const first = tbody.firstElementChild;
+                    const newest = first ? shown.get(Number(first.id.slice(4))) : null;
+                    if (newest && lic.created_at < newest.created_at) return;
+                    tbody.prepend(tr);
+                }
+                shown.set(lic.id, lic);
+                idsByKey.set(lic.key, lic.id);
+            }
+
+            function setStatus(text) {
+                document.getElementById('refreshStatus').innerText = text;
+            }
+
+            // Carga completa paginada (reset = empezar desde la primera página)
+            async function loadLicenses(reset = true) {
                 try {
-                    const res = await fetch('/licenses/list');
-                    const licenses = await res.json();
+                    const params = new URLSearchParams({ limit: PAGE_SIZE });
+                    const filters = getFilters();
+                    for (const name in filters) {
+                        if (filters[name]) params.set(name, filters[name]);
+                    }
+                    if (!reset && nextCursor) params.set('after', nextCursor);
+
+                    const res = await fetch('/licenses/list?' + params);
+                    const page = await res.json();
                     const tbody = document.getElementById('licenseTable');
-                    tbody.innerHTML = '';
-                    
-                    licenses.forEach(lic => {
-                        let expirationText = "Indefinido";
-                        let isExpired = false;
-                        
-                        if (lic.expires_at) {
-                            const expDate = new Date(lic.expires_at);
-                            const now = new Date();
-                            expirationText = expDate.toLocaleDateString();
-                            if (now > expDate) {
-                                isExpired = true;
-                                expirationText += " <br><span class='expired-tag'>VENCIDA</span>";
-                            }
-                        }
-
-                        let statusHtml = "";
-                        if (isExpired) {
-                            statusHtml = "<span class='status-expired'>EXPIRADA</span>";
-                        } else {
-                            statusHtml = lic.is_active ? "<span class='status-active'>ACTIVA</span>" : "<span class='status-inactive'>BLOQUEADA</span>";
-                        }
-
-                        const tr = document.createElement('tr');
-                        tr.innerHTML = `
-                            <td>${lic.id}</td>
-                            <td><strong>${lic.bot_name || 'Generic'}</strong></td>
-                            <td class="key-cell" onclick="copyKey(this, '${lic.key}')" title="Clic para copiar">${lic.key}</td>
-                            <td>${lic.note || '-'}</td>
-                            <td>${lic.hwid ? '<span style="font-family:monospace; font-size:0.8rem">'+lic.hwid+'</span>' : '<em style="color:#64748b;">Esperando...</em>'}</td>
-                            <td style="font-size:0.9rem">${expirationText}</td>
-                            <td>${statusHtml}</td>
-                            <td>
-                                <button class="action-btn" onclick="toggleStatus(${lic.id})">
-                                    ${lic.is_active ? 'Bloquear' : 'Activar'}
-                                </button>
-                                <button class="action-btn btn-delete" onclick="deleteLicense(${lic.id})">X</button>
-                            </td>
-                        `;
-                        tbody.appendChild(tr);
+                    if (reset) {
+                        tbody.innerHTML = '';
+                        shown.clear();
+                        idsByKey.clear();
+                        lastSync = page.server_time;
+                    }
+                    page.items.forEach(lic => {
+                        tbody.appendChild(renderRow(lic));
+                        shown.set(lic.id, lic);
+                        idsByKey.set(lic.key, lic.id);
                     });
-                    document.getElementById('refreshStatus').innerText = 'Actualizado: ' + new Date().toLocaleTimeString();
+                    nextCursor = page.next_cursor;
+                    document.getElementById('loadMore').style.display = nextCursor ? 'block' : 'none';
+                    setStatus('Actualizado: ' + new Date().toLocaleTimeString());
                 } catch (e) {
                     console.error(e);
-                    document.getElementById('refreshStatus').innerText = 'Error actualizando';
+                    setStatus('Error actualizando');
                 }
             }
 
+            // Delta: solo las filas cambiadas desde lastSync (al (re)conectar a /events)
+            async function syncChanges() {
+                if (!lastSync) return loadLicenses();
+                try {
+                    const res = await fetch('/licenses/list?' + new URLSearchParams({ updated_since: lastSync }));
+                    const delta = await res.json();
+                    if (delta.truncated) return loadLicenses();
+                    delta.deleted.forEach(removeRow);
+                    delta.items.forEach(upsertRow);
+                    lastSync = delta.server_time;
+                    setStatus('Actualizado: ' + new Date().toLocaleTimeString());
+                } catch (e) {
+                    console.error(e);
+                    setStatus('Error actualizando');
+                }
+            }
+
+            // Cambios en vivo: el servidor empuja cada alta/baja/cambio y solo se parchea esa fila
+            function applyEvent(event) {
+                if (event.type === 'upsert') {
+                    upsertRow(event.license);
+                } else if (event.type === 'patch') {
+                    const id = idsByKey.get(event.key);
+                    if (id !== undefined) upsertRow(Object.assign({}, shown.get(id), event.changes));
+                } else if (event.type === 'delete') {
+                    removeRow(event.id);
+                } else if (event.type === 'resync') {
+                    syncChanges();
+                }
+            }
+
+            function connectEvents() {
+                const source = new EventSource('/events');
+                source.onopen = () => {
+                    setStatus('Live');
+                    syncChanges(); // recupera lo ocurrido mientras no había conexión
+                };
+                source.onmessage = (msg) => {
+                    applyEvent(JSON.parse(msg.data));
+                    setStatus('Actualizado: ' + new Date().toLocaleTimeString());
+                };
+                source.onerror = () => setStatus('Reconectando...');
+            }
+
+            function onFiltersChanged() {
+                clearTimeout(filterTimer);
+                filterTimer = setTimeout(() => loadLicenses(), 300);
+            }
+
             async function createKey() {
                 const note = document.getElementById('clientName').value;
                 const botName = document.getElementById('botName').value;
@@ -319,32 +1373,38 @@ async def dashboard(request: Request):
 
                 await fetch(`/generate?note=${encodeURIComponent(note)}&bot_name=${encodeURIComponent(botName)}&duration_days=${duration}`, { method: 'POST' });
                 closeModal();
-                loadLicenses();
             }
 
             async function toggleStatus(id) {
                 await fetch(`/licenses/toggle/${id}`, { method: 'POST' });
-                loadLicenses();
             }
 
             async function deleteLicense(id) {
                 if (!confirm("¿Eliminar esta licencia permanentemente?")) return;
                 await fetch(`/licenses/delete/${id}`, { method: 'POST' });
-                loadLicenses();
             }
 
-            loadLicenses();
-            setInterval(loadLicenses, 5000);
+            loadLicenses().then(connectEvents);
         </script>
     </body>
     </html>
     """
-    return HTMLResponse(content=html_content)
+DASHBOARD_ETAG = '"' + hashlib.sha256(DASHBOARD_HTML.encode()).hexdigest()[:32] + '"'
+
+@app.get("/", response_class=HTMLResponse)
+async def dashboard(request: Request):
+    # no-cache = el navegador guarda la página pero la revalida (304) para ver cada despliegue
+    headers = {"ETag": DASHBOARD_ETAG, "Cache-Control": "no-cache"}
+    if _not_modified(request, DASHBOARD_ETAG):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=DASHBOARD_HTML, headers=headers)
 
 def open_browser():
+    import webbrowser
     webbrowser.open("http://localhost:8000")
 
 if __name__ == "__main__":
+    from threading import Timer
     import uvicorn
     # Timer para abrir el navegador después de 1.5 segundos
     Timer(1.5, open_browser).start()
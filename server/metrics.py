@@ -0,0 +1,283 @@
+"""Métricas en formato de texto de Prometheus, sin dependencias externas.
+
+Expone contadores e histogramas por ruta y motivo (reason), tiempos de las consultas
+SQL (eventos del engine), espera por conexión del pool y contadores de las cachés.
+
+Con varios workers (gunicorn) cada proceso vuelca sus valores en METRICS_DIR y /metrics
+devuelve la suma de todos, sea cual sea el worker que atienda el scrape.
+"""
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+import weakref
+
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Directorio compartido entre workers (lo crea gunicorn.conf.py); vacío = solo este proceso
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+# Segundos entre volcados de los valores de este worker a METRICS_DIR
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        labels = tuple(map(str, labels))
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        items = (self.collect() if values is None else values).items()
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [conteos por bucket..., suma, total]
+        self._lock = threading.Lock()
+
+    kind = "histogram"
+
+    def observe(self, value, *labels):
+        labels = tuple(map(str, labels))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(labels)
+            if data is None:
+                data = self._values[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def collect(self):
+        with self._lock:
+            return {labels: list(data) for labels, data in self._values.items()}
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        items = (self.collect() if values is None else values).items()
+        names = self.labelnames + ("le",)
+        for labels, data in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(names, labels + ('+Inf',))} {data[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {data[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {data[-1]}")
+        return lines
+
+
+class CallbackMetric:
+    """Valor leído al exportar (contadores/tamaños que ya llevan otros objetos)."""
+
+    def __init__(self, name, documentation, kind, callback):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.callback = callback
+
+    def collect(self):
+        return {(): self.callback()}
+
+    def render(self, values=None):
+        value = (self.collect() if values is None else values).get((), 0)
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            f"{self.name} {value}",
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def callback(self, name, documentation, callback, kind="gauge"):
+        return self.register(CallbackMetric(name, documentation, kind, callback))
+
+    def render(self):
+        if METRICS_DIR:
+            return self._render_merged()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def dump(self):
+        """Vuelca los valores de este worker en METRICS_DIR/<pid>.json (escritura atómica)."""
+        if not METRICS_DIR:
+            return
+        data = {metric.name: [[list(labels), value] for labels, value in metric.collect().items()]
+                for metric in self._metrics}
+        path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+    def _render_merged(self):
+        """Suma los valores de todos los workers. Los gauges solo cuentan procesos vivos;
+        contadores e histogramas de workers ya reiniciados se conservan (no retroceden)."""
+        self.dump()
+        merged = {metric.name: {} for metric in self._metrics}
+        for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _alive(int(os.path.basename(path)[:-len(".json")]))
+            for metric in self._metrics:
+                if metric.kind == "gauge" and not alive:
+                    continue
+                values = merged[metric.name]
+                for labels, value in data.get(metric.name, ()):
+                    labels = tuple(labels)
+                    if isinstance(value, list):
+                        current = values.setdefault(labels, [0] * len(value))
+                        values[labels] = [a + b for a, b in zip(current, value)]
+                    else:
+                        values[labels] = values.get(labels, 0) + value
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(merged[metric.name]))
+        return "\n".join(lines) + "\n"
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    "authkey_http_requests_total", "Peticiones HTTP por ruta, método, status y motivo",
+    ("route", "method", "status", "reason"),
+)
+HTTP_LATENCY = registry.histogram(
+    "authkey_http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta y motivo",
+    ("route", "method", "reason"),
+)
+DB_QUERY_LATENCY = registry.histogram(
+    "authkey_db_query_duration_seconds", "Duración de las consultas SQL por tipo de sentencia",
+    ("statement",),
+)
+DB_POOL_WAIT = registry.histogram(
+    "authkey_db_pool_checkout_wait_seconds", "Espera hasta obtener una conexión del pool",
+)
+
+# Rutas que no se miden (conexiones de larga duración o el propio scrape)
+EXCLUDED_ROUTES = {"/events", "/metrics", "/health", "/ready"}
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: cuenta y mide cada petición con la plantilla de ruta y el motivo.
+
+    El motivo sale de request.state.reason (lo fija el manejador de HTTPException a
+    partir de detail["reason"]); las respuestas sin motivo se etiquetan como "ok".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            if path not in EXCLUDED_ROUTES:
+                reason = scope.get("state", {}).get("reason", "ok" if status < 400 else "error")
+                method = scope["method"]
+                HTTP_REQUESTS.inc(path, method, status, reason)
+                HTTP_LATENCY.observe(time.perf_counter() - start, path, method, reason)
+
+
+_instrumented = weakref.WeakSet()
+
+
+def instrument_engine(engine):
+    """Mide cada consulta con los eventos del engine (sync, o engine.sync_engine en async)."""
+    if engine in _instrumented:
+        return
+    _instrumented.add(engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start"].pop()
+        kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY_LATENCY.observe(time.perf_counter() - start, kind)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        stack = context.connection.info.get("query_start") if context.connection is not None else None
+        if stack:
+            stack.pop()
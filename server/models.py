@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Index, Text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text, update
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 import datetime
 import os
@@ -13,28 +14,151 @@ class License(Base):
     id = Column(Integer, primary_key=True, index=True)
     key = Column(String, unique=True, index=True)
     hwid = Column(String, nullable=True) # Se llena al activar
-    is_active = Column(Boolean, default=True)
+    is_active = Column(Boolean, default=True, index=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     activated_at = Column(DateTime, nullable=True)
-    expires_at = Column(DateTime, nullable=True) # Fecha de vencimiento
+    expires_at = Column(DateTime, nullable=True, index=True) # Fecha de vencimiento
     note = Column(String, nullable=True) # Cliente
-    bot_name = Column(String, default="Unknown Bot") # Nombre del Bot
+    bot_name = Column(String, default="Unknown Bot", index=True) # Nombre del Bot
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, index=True) # Sincronización delta del panel
+    last_seen_at = Column(DateTime, nullable=True) # Última validación correcta (escritura diferida)
+    validation_count = Column(Integer, default=0) # Validaciones correctas acumuladas
+
+    __table_args__ = (
+        # Paginación por cursor (created_at DESC, id DESC) en /licenses/list
+        Index("ix_licenses_created_at_id", "created_at", "id"),
+    )
+
+class ValidationEvent(Base):
+    """Historial opcional de validaciones (VALIDATION_EVENTS=1), escrito en lotes."""
+    __tablename__ = "validation_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, index=True)
+    hwid = Column(String, nullable=True)
+    ip = Column(String, nullable=True)
+    reason = Column(String) # "ok" o el motivo del rechazo
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+class DeletedLicense(Base):
+    """Registro de licencias borradas para que el modo delta del panel pueda quitarlas."""
+    __tablename__ = "deleted_licenses"
+
+    id = Column(Integer, primary_key=True, index=True)
+    license_id = Column(Integer) # id que tenía la licencia
+    key = Column(String)
+    deleted_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+class LicenseChange(Base):
+    """Cambios confirmados que los demás workers aplican a su caché, filtro y panel (CHANGE_LOG=1)."""
+    __tablename__ = "license_changes"
+    # Sin AUTOINCREMENT, SQLite reutilizaría ids tras purgar la tabla y los workers no los verían
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True)
+    origin = Column(String) # Worker que hizo el cambio
+    key = Column(String, nullable=True)
+    event = Column(Text) # Evento de /events en JSON
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+# HWID que enviaba el cliente antiguo fuera de Windows (no identifica al equipo).
+# Las licencias vinculadas a él cuentan como libres: el primer HWID real las revincula.
+LEGACY_HWID = "UNKNOWN_HWID"
+
+def env_flag(name, default="0"):
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
 
 # Configuración de base de datos HÍBRIDA (Local: SQLite, Nube: PostgreSQL)
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-if DATABASE_URL:
+# Modo async (DB_ASYNC=1): los endpoints usan asyncpg/aiosqlite en lugar del threadpool
+DB_ASYNC = env_flag("DB_ASYNC")
+
+# Ajustes del pool de conexiones
+POOL_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": env_flag("DB_POOL_PRE_PING", "1"),
+}
+
+def normalize_database_url(url):
     # Ajuste necesario para Heroku/Render si la URL viene como 'postgres://' (antiguo) en vez de 'postgresql://'
-    if DATABASE_URL.startswith("postgres://"):
-        DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-    engine = create_engine(DATABASE_URL)
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+def connect_args_for(url):
+    return {"check_same_thread": False} if url.startswith("sqlite") else {}
+
+if DATABASE_URL:
+    DATABASE_URL = normalize_database_url(DATABASE_URL)
 else:
     # Modo Local (SQLite)
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     db_path = os.path.join(BASE_DIR, "licenses.db")
     DATABASE_URL = f"sqlite:///{db_path}"
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
+CONNECT_ARGS = connect_args_for(DATABASE_URL)
+
+# Los engines se crean con init_engines() al arrancar la app, no al importar este módulo
+engine = None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+def async_database_url(url):
+    """Convierte la URL síncrona en su equivalente async (asyncpg / aiosqlite)."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == "postgresql":
+        return url.set(drivername="postgresql+asyncpg")
+    if backend == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    raise ValueError(f"DB_ASYNC no soporta el motor '{backend}'")
+
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+def init_engines():
+    """Crea los engines y enlaza las sesiones. Es idempotente; no abre conexiones."""
+    global engine, async_engine
+    if engine is None:
+        engine = create_engine(DATABASE_URL, connect_args=CONNECT_ARGS, **POOL_OPTIONS)
+        SessionLocal.configure(bind=engine)
+        if DB_ASYNC:
+            async_engine = create_async_engine(async_database_url(DATABASE_URL), connect_args=CONNECT_ARGS, **POOL_OPTIONS)
+            AsyncSessionLocal.configure(bind=async_engine)
+    return engine
+
+def _migrate(conn):
+    """create_all no modifica tablas existentes: añade columnas e índices nuevos."""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                quote = conn.dialect.identifier_preparer.quote
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}"))
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+    # Filas anteriores a updated_at
+    conn.execute(update(License).where(License.updated_at.is_(None)).values(updated_at=License.created_at))
+
+def init_db(check_schema=True):
+    """Crea los engines y, si check_schema, las tablas, columnas e índices que falten."""
+    init_engines()
+    if check_schema:
+        create_schema(engine)
+
+def create_schema(target):
+    Base.metadata.create_all(bind=target)
+    with target.begin() as conn:
+        _migrate(conn)
@@ -0,0 +1,98 @@
+import datetime
+import os
+import threading
+
+from sqlalchemy import and_, case, func, or_
+
+import models
+
+# Segundos entre recuentos completos (GROUP BY) que corrigen los contadores
+STATS_RECONCILE_INTERVAL = float(os.getenv("STATS_RECONCILE_INTERVAL", "60"))
+
+FIELDS = ("total", "active", "blocked", "expired", "bound", "unbound")
+
+
+def _status(is_active, expires_at, now):
+    if expires_at is not None and expires_at <= now:
+        return "expired"
+    return "active" if is_active else "blocked"
+
+
+class LicenseStats:
+    """Conteos por bot_name × estado para /licenses/stats sin recorrer la tabla.
+
+    Los endpoints que crean, bloquean, borran o vinculan licencias ajustan los
+    contadores, y los demás workers aplican los mismos ajustes desde license_changes;
+    un recuento periódico (reconcile) corrige lo que se desvíe: las licencias que
+    expiran solas, o un cambio que coincida con el propio recuento.
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+        self.reconciled_at = None
+        self.stale = False  # importación sin ajustes por licencia: recontar antes de responder
+
+    @property
+    def ready(self):
+        return self.reconciled_at is not None
+
+    def _bump(self, bot_name, changes):
+        counts = self._counts.get(bot_name)
+        if counts is None:
+            counts = self._counts[bot_name] = dict.fromkeys(FIELDS, 0)
+        for field, delta in changes:
+            counts[field] += delta
+
+    def add(self, bot_name, is_active, hwid, expires_at, delta=1):
+        status = _status(is_active, expires_at, datetime.datetime.utcnow())
+        binding = "unbound" if hwid in (None, models.LEGACY_HWID) else "bound"
+        with self._lock:
+            self._bump(bot_name, (("total", delta), (status, delta), (binding, delta)))
+
+    def apply(self, changes):
+        """Aplica ajustes [(bot_name, is_active, hwid, expires_at, delta)], también los
+        que llegan de otros workers por license_changes (expires_at en ISO)."""
+        for bot_name, is_active, hwid, expires_at, delta in changes:
+            if isinstance(expires_at, str):
+                expires_at = datetime.datetime.fromisoformat(expires_at)
+            self.add(bot_name, is_active, hwid, expires_at, delta)
+
+    def reconcile(self, db):
+        """Recuenta con un GROUP BY y reemplaza los contadores. Se ejecuta con run_db."""
+        License = models.License
+        now = datetime.datetime.utcnow()
+        expired = and_(License.expires_at.isnot(None), License.expires_at <= now)
+        rows = db.query(
+            License.bot_name.label("bot_name"),
+            case((expired, "expired"), (License.is_active == True, "active"), else_="blocked").label("status"),  # noqa: E712
+            case((or_(License.hwid.is_(None), License.hwid == models.LEGACY_HWID), "unbound"), else_="bound").label("binding"),
+        ).subquery()
+        # Se agrupa sobre la subconsulta: PostgreSQL no reconoce dos CASE con parámetros distintos como iguales
+        grouped = db.query(rows.c.bot_name, rows.c.status, rows.c.binding, func.count()).group_by(
+            rows.c.bot_name, rows.c.status, rows.c.binding
+        )
+        counts = {}
+        for bot_name, status, binding, n in grouped:
+            bot = counts.setdefault(bot_name, dict.fromkeys(FIELDS, 0))
+            bot["total"] += n
+            bot[status] += n
+            bot[binding] += n
+        with self._lock:
+            self._counts = counts
+            self.reconciled_at = now
+            self.stale = False
+        return counts
+
+    def snapshot(self, bot_name=None):
+        with self._lock:
+            bots = {name: dict(counts) for name, counts in self._counts.items()
+                    if counts["total"] and (bot_name is None or name == bot_name)}
+        totals = dict.fromkeys(FIELDS, 0)
+        for counts in bots.values():
+            for field in FIELDS:
+                totals[field] += counts[field]
+        return {"bots": bots, "totals": totals, "reconciled_at": self.reconciled_at}
+
+
+license_stats = LicenseStats()
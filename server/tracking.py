@@ -0,0 +1,109 @@
+import datetime
+import os
+import threading
+
+from sqlalchemy import bindparam, case, func, insert, update
+
+import models
+
+# Segundos entre volcados del buffer a la DB
+TRACKING_FLUSH_INTERVAL = float(os.getenv("TRACKING_FLUSH_INTERVAL", "10"))
+# Historial de validaciones (tabla validation_events); desactivado por defecto
+VALIDATION_EVENTS = models.env_flag("VALIDATION_EVENTS")
+VALIDATION_EVENTS_RETENTION = datetime.timedelta(days=int(os.getenv("VALIDATION_EVENTS_RETENTION_DAYS", "30")))
+# Eventos máximos en memoria entre volcados; el resto se descarta (y se cuenta)
+MAX_BUFFERED_EVENTS = 100000
+
+
+class UsageTracker:
+    """Registra last_seen_at / validation_count en memoria y los escribe en lotes.
+
+    /validate solo toca un dict; un task en segundo plano llama a flush() cada
+    TRACKING_FLUSH_INTERVAL segundos con un UPDATE por lotes (executemany).
+    """
+
+    def __init__(self, record_events=False):
+        self.record_events = record_events
+        self._seen = {}  # key -> [last_seen_at, validaciones nuevas]
+        self._events = []
+        self._lock = threading.Lock()
+        self._last_prune = None
+        self.dropped_events = 0
+        self.flushes = 0  # volcados con datos; cambia el ETag del listado (last_seen_at)
+
+    def record(self, key, hwid, ip, reason, when=None):
+        when = when or datetime.datetime.utcnow()
+        with self._lock:
+            if reason == "ok":
+                entry = self._seen.get(key)
+                if entry is None:
+                    self._seen[key] = [when, 1]
+                else:
+                    entry[0] = when
+                    entry[1] += 1
+            if self.record_events:
+                if len(self._events) < MAX_BUFFERED_EVENTS:
+                    self._events.append({"key": key, "hwid": hwid, "ip": ip, "reason": reason, "created_at": when})
+                else:
+                    self.dropped_events += 1
+
+    def flush(self, db):
+        """Vuelca lo acumulado. Se ejecuta con run_db (hilo o run_sync), nunca en una petición."""
+        with self._lock:
+            seen, self._seen = self._seen, {}
+            events, self._events = self._events, []
+        if not seen and not events:
+            return 0
+
+        table = models.License.__table__
+        try:
+            if seen:
+                stmt = (
+                    update(table)
+                    .where(table.c.key == bindparam("b_key"))
+                    .values(
+                        # Otro worker pudo volcar antes una validación más reciente: nunca retroceder
+                        last_seen_at=case(
+                            (table.c.last_seen_at > bindparam("b_seen"), table.c.last_seen_at),
+                            else_=bindparam("b_seen"),
+                        ),
+                        validation_count=func.coalesce(table.c.validation_count, 0) + bindparam("b_count"),
+                        # No es un cambio de la licencia: no debe aparecer en el delta del panel
+                        updated_at=table.c.updated_at,
+                    )
+                )
+                db.execute(stmt, [{"b_key": key, "b_seen": when, "b_count": count} for key, (when, count) in seen.items()])
+            if events:
+                db.execute(insert(models.ValidationEvent.__table__), events)
+                self._prune_events(db)
+            db.commit()
+            if seen:
+                self.flushes += 1
+        except Exception:
+            db.rollback()
+            self._restore(seen, events)
+            raise
+        return len(seen) + len(events)
+
+    def _restore(self, seen, events):
+        # Si la DB falla, los datos vuelven al buffer para el siguiente intento
+        with self._lock:
+            for key, (when, count) in seen.items():
+                entry = self._seen.get(key)
+                if entry is None:
+                    self._seen[key] = [when, count]
+                else:
+                    entry[0] = max(entry[0], when)
+                    entry[1] += count
+            self._events = (events + self._events)[:MAX_BUFFERED_EVENTS]
+
+    def _prune_events(self, db):
+        now = datetime.datetime.utcnow()
+        if self._last_prune and now - self._last_prune < datetime.timedelta(hours=1):
+            return
+        self._last_prune = now
+        events = models.ValidationEvent.__table__
+        db.execute(events.delete().where(events.c.created_at < now - VALIDATION_EVENTS_RETENTION))
+
+
+usage_tracker = UsageTracker(record_events=VALIDATION_EVENTS)
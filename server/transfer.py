@@ -0,0 +1,174 @@
+"""Exportación / importación de la tabla licenses en streaming (CSV o JSONL).
+
+Lo usan /licenses/export, /licenses/import y el CLI migrate_db.py. Las filas se leen
+con un cursor del lado del servidor (stream_results + yield_per) y se escriben en
+bloques con upsert por key, así la memoria no crece con el tamaño de la tabla.
+"""
+import csv
+import datetime
+import io
+import json
+
+from sqlalchemy import Boolean, DateTime, Integer, bindparam, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+import models
+
+# Columnas que viajan (el id es propio de cada base: se cruza por key)
+COLUMNS = [column.name for column in models.License.__table__.columns if column.name != "id"]
+CHUNK_SIZE = 5000
+FORMATS = ("csv", "jsonl")
+TRUE_VALUES = ("1", "true", "yes", "on")
+# Columnas con valor por defecto del modelo: vacías en el archivo = no se tocan (o default al insertar)
+DEFAULTED = ("is_active", "created_at", "bot_name", "validation_count")
+
+
+def iter_chunks(conn, chunk_size=CHUNK_SIZE, bot_name=None):
+    """Recorre la tabla en bloques de dicts sin cargarla entera en memoria."""
+    table = models.License.__table__
+    stmt = select(*(table.c[name] for name in COLUMNS)).order_by(table.c.id)
+    if bot_name:
+        stmt = stmt.where(table.c.bot_name == bot_name)
+    result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(stmt)
+    for partition in result.mappings().partitions():
+        yield [dict(row) for row in partition]
+
+
+def _to_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def serialize(rows, format, header=False):
+    """Convierte un bloque de filas a texto CSV (con cabecera si header) o JSONL."""
+    if format == "jsonl":
+        return "".join(json.dumps({name: row[name] for name in COLUMNS}, default=_to_text) + "\n" for row in rows)
+    out = io.StringIO()
+    writer = csv.writer(out)
+    if header:
+        writer.writerow(COLUMNS)
+    for row in rows:
+        writer.writerow([_to_text(row[name]) for name in COLUMNS])
+    return out.getvalue()
+
+
+def _coerce(row):
+    """Convierte los valores leídos (texto CSV o JSON) a los tipos de cada columna.
+
+    Solo devuelve las columnas que trae el archivo: las que faltan no se modifican en
+    las licencias existentes y toman el valor por defecto del modelo en las nuevas.
+    """
+    if not isinstance(row, dict):
+        raise ValueError("Se esperaba un objeto JSON")
+    table = models.License.__table__
+    values = {}
+    for name in COLUMNS:
+        if name not in row:
+            continue
+        value = row[name]
+        if value == "" or value is None:
+            if name not in DEFAULTED:
+                values[name] = None
+            continue
+        values[name] = _convert(name, table.c[name].type, value)
+    if not values.get("key"):
+        raise ValueError("Fila sin key")
+    return values
+
+
+def _convert(name, column_type, value):
+    """Valor del tipo de la columna; ValueError (no un error de la DB) si no encaja."""
+    if isinstance(column_type, DateTime):
+        if isinstance(value, str):
+            return datetime.datetime.fromisoformat(value)
+    elif isinstance(column_type, Boolean):
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str):
+            return value.strip().lower() in TRUE_VALUES
+    elif isinstance(column_type, Integer):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        if isinstance(value, str):
+            return int(value)
+    elif isinstance(value, str):
+        return value
+    raise ValueError(f"Valor inválido en {name}: {value!r}")
+
+
+def parse(text_file, format):
+    """Lee filas de un archivo de texto CSV (con cabecera) o JSONL, una a una."""
+    if format == "jsonl":
+        for number, line in enumerate(text_file, 1):
+            if line.strip():
+                try:
+                    yield _coerce(json.loads(line))
+                except ValueError as e:
+                    raise ValueError(f"Línea {number}: {e}")
+        return
+    for row in csv.DictReader(text_file):
+        try:
+            yield _coerce(row)
+        except ValueError as e:
+            raise ValueError(f"Fila {row.get('key') or '?'}: {e}")
+
+
+def read_chunks(rows, chunk_size=CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def upsert(db, rows):
+    """Inserta las filas o, si la key ya existe, actualiza solo las columnas que trae cada fila.
+
+    SQLite y PostgreSQL usan INSERT ... ON CONFLICT (key) DO UPDATE; otros motores,
+    un UPDATE para las keys existentes y un INSERT para el resto. El llamador hace commit.
+    """
+    # Una key repetida dentro del bloque rompería el ON CONFLICT: gana la última
+    rows = list({row["key"]: row for row in rows}.values())
+    # Cada sentencia lleva un mismo juego de columnas (en JSONL pueden variar por línea)
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    for columns, group in groups.items():
+        _upsert_group(db, [name for name in columns if name != "key"], group)
+
+
+def _upsert_group(db, columns, rows):
+    table = models.License.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(table)
+        if columns:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.key],
+                set_={name: stmt.excluded[name] for name in columns},
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=[table.c.key])
+        db.execute(stmt, rows)
+        return
+
+    keys = [row["key"] for row in rows]
+    existing = set(db.execute(select(table.c.key).where(table.c.key.in_(keys))).scalars())
+    updates = [{"b_" + name: value for name, value in row.items()} for row in rows if row["key"] in existing]
+    inserts = [row for row in rows if row["key"] not in existing]
+    if updates and columns:
+        db.execute(
+            update(table)
+            .where(table.c.key == bindparam("b_key"))
+            .values({name: bindparam("b_" + name) for name in columns}),
+            updates,
+        )
+    if inserts:
+        db.execute(table.insert(), inserts)
@@ -0,0 +1,93 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server"))
+import changes
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(changes.time, "monotonic", lambda: now[0])
+    return now
+
+
+def make_feed(floor, seen=()):
+    feed = changes.ChangeFeed()
+    feed.floor = floor
+    feed._seen = set(seen)
+    return feed
+
+
+def test_advance_consecutive_ids(clock):
+    feed = make_feed(10, {11, 12, 13})
+    feed._advance()
+    assert feed.floor == 13
+    assert feed._seen == set()
+    assert feed._gap_since is None
+
+
+def test_advance_waits_for_gap(clock):
+    feed = make_feed(10, {11, 13})
+    feed._advance()
+    assert feed.floor == 11
+    assert feed._seen == {13}
+    assert feed._gap_since == 1000.0
+
+    clock[0] += changes.GAP_TIMEOUT
+    feed._advance()
+    assert feed.floor == 11
+
+
+def test_advance_gap_filled_in_time(clock):
+    feed = make_feed(10, {12})
+    feed._advance()
+    clock[0] += 5
+    feed._seen.add(11)
+    feed._advance()
+    assert feed.floor == 12
+    assert feed._gap_since is None
+
+
+def test_advance_skips_expired_gap(clock):
+    feed = make_feed(10, {12, 13})
+    feed._advance()
+    clock[0] += changes.GAP_TIMEOUT + 1
+    feed._advance()
+    assert feed.floor == 13
+    assert feed._seen == set()
+    assert feed._gap_since is None
+
+
+def test_advance_new_gap_gets_its_own_timeout(clock):
+    # Hueco en 12; más tarde se llena y floor se detiene en un hueco nuevo (15)
+    feed = make_feed(10, {11, 13, 14, 16})
+    feed._advance()
+    assert feed.floor == 11
+    clock[0] += changes.GAP_TIMEOUT - 1
+    feed._seen.add(12)
+    feed._advance()
+    assert feed.floor == 14
+    assert feed._gap_since == clock[0]
+
+    # El hueco 15 no hereda el plazo del 12: todavía no se salta
+    clock[0] += 2
+    feed._advance()
+    assert feed.floor == 14
+
+    clock[0] += changes.GAP_TIMEOUT
+    feed._advance()
+    assert feed.floor == 16
+
+
+def test_advance_only_skips_one_gap_at_a_time(clock):
+    feed = make_feed(10, {12, 14})
+    feed._advance()
+    clock[0] += changes.GAP_TIMEOUT + 1
+    feed._advance()
+    # Se salta el hueco 11, pero el 13 acaba de aparecer como frontera
+    assert feed.floor == 12
+    assert feed._seen == {14}
+    assert feed._gap_since == clock[0]
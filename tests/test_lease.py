@@ -0,0 +1,135 @@
+import base64
+import datetime
+import json
+import os
+import sys
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "server"))
+sys.path.insert(0, ROOT)
+import lease
+from client import security
+
+
+def _keypair():
+    private_key = Ed25519PrivateKey.generate()
+    private_raw = private_key.private_bytes(
+        serialization.Encoding.Raw, serialization.PrivateFormat.Raw, serialization.NoEncryption()
+    )
+    public_raw = private_key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    return base64.b64encode(private_raw).decode(), base64.b64encode(public_raw).decode()
+
+
+@pytest.fixture
+def keys(monkeypatch):
+    private, public = _keypair()
+    monkeypatch.setattr(lease, "LEASE_SIGNING_KEY", private)
+    monkeypatch.setattr(lease, "LEASE_SECONDS", 3600)
+    monkeypatch.setattr(lease, "_signer", None)
+    monkeypatch.setattr(security, "LEASE_PUBLIC_KEY", public)
+    return private, public
+
+
+def _sign(private, payload_bytes):
+    signer = Ed25519PrivateKey.from_private_bytes(base64.b64decode(private))
+    body = lease._b64encode(payload_bytes)
+    return body + "." + lease._b64encode(signer.sign(body.encode()))
+
+
+def test_round_trip(keys):
+    token = lease.issue_lease("KEY-1", "pc-1", None)
+    payload = security.verify_lease(token, "KEY-1", "pc-1")
+    assert payload["k"] == "KEY-1"
+    assert payload["h"] == "pc-1"
+    assert payload["exp"] is None
+    assert payload["lex"] == payload["iat"] + 3600
+
+
+def test_lease_never_outlives_license(keys):
+    expires_at = datetime.datetime.utcnow() + datetime.timedelta(minutes=10)
+    payload = security.verify_lease(lease.issue_lease("KEY-1", "pc-1", expires_at), "KEY-1", "pc-1")
+    assert payload["lex"] == payload["exp"]
+    assert payload["lex"] < payload["iat"] + 3600
+
+
+def test_no_signing_key_issues_nothing(monkeypatch):
+    monkeypatch.setattr(lease, "LEASE_SIGNING_KEY", None)
+    monkeypatch.setattr(lease, "_signer", None)
+    assert lease.issue_lease("KEY-1", "pc-1", None) is None
+
+
+def test_no_public_key_rejects(keys, monkeypatch):
+    token = lease.issue_lease("KEY-1", "pc-1", None)
+    monkeypatch.setattr(security, "LEASE_PUBLIC_KEY", "")
+    assert security.verify_lease(token, "KEY-1", "pc-1") is None
+
+
+def test_tampered_payload(keys):
+    token = lease.issue_lease("KEY-1", "pc-1", None)
+    body, signature = token.split(".")
+    payload = json.loads(security._b64decode(body))
+    payload["lex"] += 10 ** 6
+    forged = lease._b64encode(json.dumps(payload, separators=(",", ":")).encode()) + "." + signature
+    assert security.verify_lease(forged, "KEY-1", "pc-1") is None
+
+
+def test_tampered_signature(keys):
+    body, signature = lease.issue_lease("KEY-1", "pc-1", None).split(".")
+    raw = bytearray(security._b64decode(signature))
+    raw[0] ^= 0x01
+    assert security.verify_lease(body + "." + lease._b64encode(bytes(raw)), "KEY-1", "pc-1") is None
+
+
+def test_signed_with_another_key(keys):
+    other_private, _ = _keypair()
+    payload = {"k": "KEY-1", "h": "pc-1", "exp": None, "iat": int(time.time()), "lex": int(time.time()) + 3600}
+    token = _sign(other_private, json.dumps(payload).encode())
+    assert security.verify_lease(token, "KEY-1", "pc-1") is None
+
+
+def test_wrong_key_or_hwid(keys):
+    token = lease.issue_lease("KEY-1", "pc-1", None)
+    assert security.verify_lease(token, "KEY-2", "pc-1") is None
+    assert security.verify_lease(token, "KEY-1", "pc-2") is None
+
+
+def test_expired_lease(keys):
+    token = lease.issue_lease("KEY-1", "pc-1", None)
+    assert security.verify_lease(token, "KEY-1", "pc-1", now=time.time() + 3599) is not None
+    assert security.verify_lease(token, "KEY-1", "pc-1", now=time.time() + 3601) is None
+
+
+def test_expired_license(keys):
+    private, _ = keys
+    now = int(time.time())
+    # exp vencido aunque lex siga vigente (token fabricado a mano, issue_lease nunca lo emitiría)
+    payload = {"k": "KEY-1", "h": "pc-1", "exp": now - 1, "iat": now, "lex": now + 3600}
+    assert security.verify_lease(_sign(private, json.dumps(payload).encode()), "KEY-1", "pc-1") is None
+
+
+@pytest.mark.parametrize("token", [
+    None,
+    "",
+    "sin-punto",
+    "a.b.c",
+    "!!!.???",
+    "e30.AAAA",
+])
+def test_malformed_token(keys, token):
+    assert security.verify_lease(token, "KEY-1", "pc-1") is None
+
+
+@pytest.mark.parametrize("payload", [
+    b"no es json",
+    b"[1, 2, 3]",
+    b'{"k": "KEY-1", "h": "pc-1"}',
+    b'{"k": "KEY-1", "h": "pc-1", "exp": null, "iat": 0, "lex": "manana"}',
+])
+def test_signed_but_malformed_payload(keys, payload):
+    private, _ = keys
+    assert security.verify_lease(_sign(private, payload), "KEY-1", "pc-1") is None
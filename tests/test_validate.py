@@ -0,0 +1,81 @@
+import datetime
+import os
+import sys
+import threading
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server"))
+import main
+import models
+from cache import license_cache
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'licenses.db'}", connect_args={"check_same_thread": False})
+    models.create_schema(engine)
+    license_cache.clear()
+    yield engine
+    engine.dispose()
+
+
+def add_license(engine, key, hwid=None):
+    with Session(engine) as db:
+        db.add(models.License(key=key, hwid=hwid))
+        db.commit()
+
+
+def test_validate_bound_key_is_one_select(engine):
+    add_license(engine, "BOUND", hwid="pc-1")
+    statements = []
+
+    def before_execute(conn, cursor, statement, *args):
+        statements.append(statement.split()[0])
+
+    event.listen(engine, "before_cursor_execute", before_execute)
+    with Session(engine) as db:
+        assert main._validate(db, "BOUND", "pc-1")["valid"]
+    assert statements == ["SELECT"]
+
+
+def test_validate_binds_unbound_key(engine):
+    add_license(engine, "FREE")
+    with Session(engine) as db:
+        assert main._validate(db, "FREE", "pc-1")["message"] == "Clave activada y vinculada exitosamente"
+    with Session(engine) as db:
+        with pytest.raises(HTTPException) as exc:
+            main._validate(db, "FREE", "pc-2")
+    assert exc.value.detail["reason"] == "hwid_mismatch"
+
+
+def test_concurrent_binds_have_one_winner(engine):
+    add_license(engine, "RACE")
+    workers = 8
+    barrier = threading.Barrier(workers)
+    results = []
+
+    def bind(hwid):
+        with Session(engine) as db:
+            # Todos leen la key sin vincular antes de que nadie haga el UPDATE
+            state = main._load_state(db, "RACE")
+            assert state.hwid is None
+            barrier.wait()
+            bound, _ = main._bind_hwid(db, "RACE", hwid, datetime.datetime.utcnow())
+            db.commit()
+            results.append((hwid, bound is not None))
+
+    threads = [threading.Thread(target=bind, args=(f"pc-{n}",)) for n in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    winners = [hwid for hwid, won in results if won]
+    assert len(results) == workers
+    assert len(winners) == 1
+    with Session(engine) as db:
+        assert db.query(models.License.hwid).filter(models.License.key == "RACE").scalar() == winners[0]